@@ -0,0 +1,281 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261017
+# Micro-benchmarks for eLyXer internals.
+
+import sys
+import os.path
+import glob
+import time
+import codecs
+import shutil
+import tempfile
+from elyxer.io.fileline import *
+from elyxer.util.trace import Trace
+from elyxer.util.options import *
+from elyxer.parse.lexer import *
+from elyxer.gen.factory import *
+from elyxer.bib.pub import *
+
+
+class Benchmark(object):
+  "A benchmark run on a set of files."
+
+  name = None
+  defaults = ['test/*.lyx']
+
+  def run(self, filenames):
+    "Run the benchmark on the given files."
+    Trace.error('Unimplemented run()')
+
+  def readlines(self, filenames):
+    "Read all lines in the given files."
+    lines = []
+    for filename in filenames:
+      reader = LineReader(filename)
+      while not reader.finished():
+        lines.append(reader.currentline())
+        reader.nextline()
+      reader.close()
+    return lines
+
+  def parsedocuments(self, filenames):
+    "Parse all documents into containers, without processing."
+    containers = []
+    for filename in filenames:
+      reader = LyXLexer(LineReader(filename))
+      factory = ContainerFactory()
+      while not reader.finished():
+        container = factory.createcontainer(reader)
+        if container:
+          containers.append(container)
+      reader.close()
+    return containers
+
+  def extractformulas(self, filenames):
+    "Extract the TeX code of all formulas in the given documents."
+    formulas = []
+    for container in self.parsedocuments(filenames):
+      for formula in container.searchall(Formula):
+        formulas.append(formula.parsed)
+    return formulas
+
+  def time(self, function, repeat = 3):
+    "Time a function, return the best time in seconds."
+    best = None
+    for i in range(repeat):
+      start = time.time()
+      function()
+      elapsed = time.time() - start
+      if best == None or elapsed < best:
+        best = elapsed
+    return best
+
+  def report(self, label, count, unit, seconds):
+    "Report the rate of a measurement."
+    rate = 0
+    if seconds > 0:
+      rate = count / seconds
+    Trace.show(self.name + ' ' + label + ': ' + unicode(count) + ' ' + unit
+        + ' in ' + '%.3f' % seconds + ' s, ' + '%.0f' % rate + ' ' + unit + '/s',
+        sys.stdout)
+
+class FactoryBenchmark(Benchmark):
+  "Measure the container dispatch and parsing speed in lines per second."
+
+  name = 'factory'
+
+  def run(self, filenames):
+    "Run the dispatch table on every line, then parse every document."
+    lines = self.readlines(filenames)
+    factory = ContainerFactory()
+    seconds = self.time(lambda: self.dispatch(factory, lines))
+    self.report('dispatch', len(lines), 'lines', seconds)
+    seconds = self.time(lambda: self.parsedocuments(filenames))
+    self.report('parse', len(lines), 'lines', seconds)
+
+  def dispatch(self, factory, lines):
+    "Find the container type for all lines."
+    for line in lines:
+      factory.tree.findline(line)
+
+class EndingsBenchmark(Benchmark):
+  "Measure formula parsing with deeply nested endings, in chars per second."
+
+  name = 'endings'
+  defaults = ['docs/math.lyx']
+  depth = 8
+
+  def run(self, filenames):
+    "Parse fractions and brackets as they are, then nested."
+    formulas = []
+    for formula in self.extractformulas(filenames):
+      if '\\frac' in formula or '\\left' in formula:
+        formulas.append(formula)
+    self.measure('flat', formulas)
+    self.measure('nested', [self.nest(formula) for formula in formulas])
+
+  def nest(self, formula):
+    "Nest a formula inside fractions and brackets."
+    for level in range(self.depth):
+      formula = '\\left(\\frac{' + formula + '}{2}\\right)'
+    return formula
+
+  def measure(self, label, formulas):
+    "Measure the time to parse the given formulas."
+    chars = sum([len(formula) for formula in formulas])
+    seconds = self.time(lambda: self.parseall(formulas))
+    self.report(label + ' (' + unicode(len(formulas)) + ' formulas)', chars, 'chars', seconds)
+
+  def parseall(self, formulas):
+    "Parse all formulas."
+    for formula in formulas:
+      FormulaFactory().parseformula(formula)
+
+class ProcessorBenchmark(Benchmark):
+  "Measure formula processing after parsing, in formulas per second."
+
+  name = 'processor'
+  defaults = ['test/math-1-6.lyx', 'docs/math.lyx']
+  repeat = 20
+
+  def run(self, filenames):
+    "Parse all formulas, then process them in inline or display mode."
+    "Macro definitions (in the preamble and in formulas) are parsed first"
+    "so that macros can be expanded."
+    formulas = []
+    for container in self.parsedocuments(filenames):
+      for preamble in container.searchall(LyXPreamble):
+        preamble.process()
+      for formula in container.searchall(Formula):
+        if isinstance(formula, FormulaMacro):
+          FormulaFactory().parseformula(formula.parsed)
+        else:
+          formulas.append((formula.parsed, formula.header[0] != 'inline'))
+    best = None
+    for index in range(self.repeat):
+      seconds = self.processall(formulas)
+      if best == None or seconds < best:
+        best = seconds
+    self.report('process', len(formulas), 'formulas', best)
+
+  def processall(self, formulas):
+    "Parse the given formulas and time their processing."
+    wholes = []
+    for parsed, display in formulas:
+      wholes.append((FormulaFactory().parseformula(parsed), display))
+    start = time.time()
+    for whole, display in wholes:
+      DocumentParameters.displaymode = display
+      FormulaProcessor().process(whole)
+    return time.time() - start
+
+class BibTeXBenchmark(Benchmark):
+  "Measure BibTeX parsing with and without the fast tokenizer, in entries per second."
+
+  name = 'bibtex'
+  defaults = ['test/bibtex-*.bib']
+  scale = 100
+
+  def run(self, filenames):
+    "Scale up the given files into a single file, and parse it both ways."
+    directory = tempfile.mkdtemp()
+    try:
+      self.writescaled(filenames, os.path.join(directory, 'scaled.bib'))
+      Options.directory = directory
+      for label, tokenizer in [('slow', DecliningTokenizer()), ('fast', BibTokenizer())]:
+        PubEntry.tokenizer = tokenizer
+        entries = len(self.parse())
+        seconds = self.time(self.parse)
+        self.report(label, entries, 'entries', seconds)
+    finally:
+      shutil.rmtree(directory)
+
+  def writescaled(self, filenames, scaled):
+    "Write the contents of all files, repeated, into a scaled file."
+    text = ''
+    for filename in filenames:
+      text += ''.join(BulkFile(filename).readall()) + '\n'
+    file = codecs.open(scaled, 'w', 'utf-8')
+    for index in range(self.scale):
+      file.write(text)
+    file.close()
+
+  def parse(self):
+    "Parse the scaled file and return all entries."
+    bibfile = BibFile('scaled', True)
+    bibfile.parse()
+    return bibfile.entries
+
+class DecliningTokenizer(BibTokenizer):
+  "A tokenizer that declines all entries, so that they are parsed slowly."
+
+  def tokenize(self, pos, parser):
+    "Decline the entry."
+    return False
+
+class BenchmarkRunner(object):
+  "Run benchmarks from the command line."
+
+  benchmarks = [FactoryBenchmark, EndingsBenchmark, ProcessorBenchmark, BibTeXBenchmark]
+  root = os.path.join(os.path.dirname(sys.argv[0]), '..')
+
+  def run(self, args):
+    "Run the benchmark given in the arguments."
+    del args[0]
+    if len(args) == 0:
+      self.usage()
+      return
+    name = args[0]
+    del args[0]
+    for type in BenchmarkRunner.benchmarks:
+      if type.name == name:
+        benchmark = type()
+        filenames = args
+        if len(filenames) == 0:
+          filenames = self.getdefaults(type)
+        benchmark.run(filenames)
+        return
+    Trace.error('Unknown benchmark ' + name)
+    self.usage()
+
+  def getdefaults(self, type):
+    "Get the default files for a type of benchmark."
+    filenames = []
+    for pattern in type.defaults:
+      found = glob.glob(os.path.join(BenchmarkRunner.root, pattern))
+      found.sort()
+      filenames += found
+    return filenames
+
+  def usage(self):
+    "Show command line help."
+    Trace.error('Usage: benchmark.py name [file...]')
+    Trace.error('Run a micro-benchmark on the given files (by default, the test corpus).')
+    Trace.error('Part of the eLyXer package (http://elyxer.nongnu.org/).')
+    Trace.error('  Available benchmarks:')
+    for type in BenchmarkRunner.benchmarks:
+      Trace.error('    ' + type.name + ': ' + type.__doc__)
+
+Trace.quietmode = True
+BenchmarkRunner().run(sys.argv)
+
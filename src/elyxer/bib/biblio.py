@@ -29,6 +29,7 @@ from elyxer.out.output import *
 from elyxer.ref.link import *
 from elyxer.gen.layout import *
 from elyxer.proc.postprocess import *
+from elyxer.util.context import *
 
 
 class BiblioCitation(Container):
@@ -156,3 +157,8 @@ class BiblioEntry(Container):
     self.contents.pop(-1)
     self.contents.append(Constant('] '))
 
+ConversionContext.register(BiblioCitation, 'citations', dict)
+ConversionContext.register(BiblioCite, 'cites', dict)
+ConversionContext.register(BiblioEntry, 'entries', dict)
+ConversionContext.register(BiblioReference, 'references', dict)
+
@@ -34,6 +34,8 @@ from elyxer.bib.tag import *
 class PubEntry(BibEntry):
   "A publication entry"
 
+  tokenizer = BibTokenizer()
+
   def __init__(self):
     self.output = TaggedOutput().settag('p class="biblio"', True)
 
@@ -42,9 +44,11 @@ class PubEntry(BibEntry):
     return pos.checkfor('@')
 
   def parse(self, pos):
-    "Parse the publication entry."
+    "Parse the publication entry, with the fast tokenizer if possible."
     self.parser = BibTagParser()
-    self.parser.parse(pos)
+    if not self.tokenizer.tokenize(pos, self.parser):
+      self.parser = BibTagParser()
+      self.parser.parse(pos)
     self.type = self.parser.type
 
   def isvisible(self):
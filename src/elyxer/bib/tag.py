@@ -22,6 +22,7 @@
 # Alex 20101027
 # eLyXer BibTeX tag parsing
 
+import re
 from elyxer.util.trace import Trace
 from elyxer.util.clone import *
 from elyxer.conf.config import *
@@ -30,6 +31,7 @@ from elyxer.gen.container import *
 from elyxer.maths.formula import *
 from elyxer.maths.command import *
 from elyxer.tex.texcode import *
+from elyxer.util.context import *
 
 
 class BibTagParser(object):
@@ -73,14 +75,18 @@ class BibTagParser(object):
     if not value:
       self.key = key
       return
+    self.settag(key, value)
+    if not pos.finished():
+      remainder = pos.globexcluding(',')
+      pos.error('Ignored ' + remainder + ' before comma')
+
+  def settag(self, key, value):
+    "Set the value for a tag, and dissect it if necessary."
     name = key.lower()
     self.tags[name] = value
     if hasattr(self, 'dissect' + name):
       dissector = getattr(self, 'dissect' + name)
       dissector(value.extracttext())
-    if not pos.finished():
-      remainder = pos.globexcluding(',')
-      pos.error('Ignored ' + remainder + ' before comma')
 
   def getkeyvalue(self, pos):
     "Parse a string of the form key=value."
@@ -199,7 +205,10 @@ class BibTag(Container):
   def parsetext(self, pos):
     "Parse a bit of text, try to substitute strings with string defs."
     text = pos.globexcluding(self.valueseparators)
-    key = text.strip()
+    self.addtext(text.strip())
+
+  def addtext(self, key):
+    "Add a bit of text, or the string def if the text is a defined string."
     if key == '':
       return
     if key in self.stringdefs:
@@ -246,6 +255,164 @@ class BibTag(Container):
     "Return a printable representation."
     return 'BibTag: ' + self.extracttext()
 
+class BibTokenizer(object):
+  "A fast tokenizer for BibTeX publication entries in a text position."
+  "The whole entry is scanned with regular expressions, and then the same"
+  "tags are built that BibTagParser would build. Plain values (even with"
+  "nested braces) become text directly; values with TeX commands or"
+  "formulas are parsed as usual at their position."
+  "Any entry with errors or comments is declined, to be parsed slowly."
+
+  typepattern = re.compile(r'[^{="#]*')
+  piecepattern = re.compile(r'[^{="#,}]*')
+  textpattern = re.compile(r'[^{"#},]*')
+  specialpattern = re.compile(r'[{}"\\$%]')
+  spacepattern = re.compile(r'\s*', re.UNICODE)
+  compresspattern = re.compile(r'\s+', re.UNICODE)
+  bracepattern = re.compile(r'[{}]')
+
+  def tokenize(self, pos, parser):
+    "Tokenize the entry at the current position into the parser."
+    "Return False if declined, leaving the position where it was."
+    if not isinstance(pos, TextPosition) or len(pos.endinglist.endings) > 0:
+      return False
+    scanned = self.scanentry(pos.text, pos.pos)
+    if not scanned:
+      return False
+    start = pos.pos
+    type, end, tags = scanned
+    parser.type = type
+    for key, values in tags:
+      if values == None:
+        parser.key = key
+        continue
+      tag = BibTag()
+      for value in values:
+        if not self.addvalue(tag, value, pos):
+          Trace.debug('Declined BibTeX entry at ' + pos.identifier())
+          pos.pos = start
+          pos.endinglist = EndingList()
+          return False
+      parser.settag(key, tag)
+    pos.pos = end
+    return True
+
+  def scanentry(self, text, index):
+    "Scan an entry starting at @; return its type, end and tags, or None."
+    end = self.typepattern.match(text, index).end()
+    if end >= len(text) or text[end] != '{':
+      return None
+    type = text[index:end].strip()
+    index = self.skipspace(text, end + 1)
+    tags = []
+    while index < len(text) and text[index] != '}':
+      if text[index] == '{':
+        return None
+      index = self.scantag(text, index, tags)
+      if index == None:
+        return None
+    if index >= len(text):
+      return None
+    return (type, self.skipspace(text, index + 1), tags)
+
+  def scantag(self, text, index, tags):
+    "Scan a tag key = value, or a lone key; return the index after it."
+    end = self.piecepattern.match(text, index).end()
+    if end >= len(text):
+      return None
+    piece = text[index:end].strip()
+    if text[end] in ',}':
+      if piece != '':
+        tags.append((piece, None))
+      return self.skipcomma(text, end)
+    if text[end] != '=' or piece == '':
+      return None
+    index = self.skipspace(text, end + 1)
+    if index >= len(text) or text[index] == ',':
+      return None
+    values = []
+    while True:
+      end = self.textpattern.match(text, index).end()
+      if end >= len(text):
+        return None
+      values.append(text[index:end].strip())
+      index = end
+      if text[index] in ',}':
+        tags.append((piece.lower(), values))
+        return self.skipcomma(text, index)
+      if text[index] == '#':
+        index += 1
+      else:
+        index = self.scanvalue(text, index, values)
+        if index == None:
+          return None
+
+  def scanvalue(self, text, index, values):
+    "Scan a value in brackets or quotes; return the index after it."
+    opening = text[index]
+    closing = '}'
+    if opening == '"':
+      closing = '"'
+    start = index + 1
+    plain = True
+    depth = 0
+    index = start
+    while True:
+      match = self.specialpattern.search(text, index)
+      if not match:
+        return None
+      char = match.group()
+      index = match.end()
+      if char == '%':
+        return None
+      if char == closing and depth == 0:
+        break
+      if char == '\\':
+        plain = False
+        index += 1
+      elif char == '$':
+        plain = False
+      elif char == '{':
+        depth += 1
+      elif char == '}':
+        if depth == 0:
+          return None
+        depth -= 1
+    end = index
+    if opening == '"':
+      end = self.skipspace(text, index)
+    values.append((opening, start, index - 1, end, plain))
+    return index
+
+  def addvalue(self, tag, value, pos):
+    "Add a scanned value to the tag; return False if it cannot be parsed."
+    if isinstance(value, basestring):
+      tag.addtext(value)
+      return True
+    opening, start, close, end, plain = value
+    if plain:
+      tex = TeXCode()
+      for piece in self.bracepattern.split(pos.text[start:close]):
+        tex.addplain(self.compresspattern.sub(' ', piece))
+      tag.add(tex)
+      return True
+    pos.pos = start - 1
+    if opening == '{':
+      tag.parsebracket(pos)
+    else:
+      tag.parsequoted(pos)
+    return pos.pos == end
+
+  def skipspace(self, text, index):
+    "Skip any whitespace at the index, and return the index after it."
+    return self.spacepattern.match(text, index).end()
+
+  def skipcomma(self, text, index):
+    "Skip a comma at the index if present, and return the index after it."
+    if text[index] == ',':
+      return index + 1
+    return index
+
 class BibAuthor(object):
   "A BibTeX individual author."
 
@@ -299,3 +466,5 @@ class BibAuthor(object):
       result += firstname + ' '
     return result + self.surname
 
+ConversionContext.register(BibTag, 'stringdefs', dict)
+
@@ -211,7 +211,7 @@ class SpecialEntry(BibEntry):
       if pos.checkfor('{'):
         self.parse(pos)
       else:
-        pos.skipcurrent()
+        pos.globexcluding('{')
     pos.popending()
 
   def isvisible(self):
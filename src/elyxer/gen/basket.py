@@ -36,15 +36,32 @@ class Basket(object):
     self.writer = writer
     return self
 
+  def detach(self, container):
+    "Detach all elements of a container from their parents."
+    container.locateprocess(lambda element: True, self.detachelement)
+
+  def detachelement(self, element):
+    "Detach an element from its parent."
+    element.parent = None
+
 class WriterBasket(Basket):
   "A writer of containers. Just writes them out to a writer."
+  "Each container is written when the next one arrives,"
+  "since postprocessing may still change it."
+
+  pending = None
 
   def write(self, container):
-    "Write a container to the line writer."
-    self.writer.write(container.gethtml())
+    "Write the pending container to the line writer, keep the new one."
+    if self.pending:
+      self.pending.writehtml(self.writer)
+    self.pending = container
 
   def finish(self):
-    "Mark as finished."
+    "Write the last container and mark as finished."
+    if self.pending:
+      self.pending.writehtml(self.writer)
+    self.pending = None
     self.writer.close()
 
 class KeeperBasket(Basket):
@@ -64,7 +81,7 @@ class KeeperBasket(Basket):
   def flush(self):
     "Flush the contents to the writer."
     for container in self.contents:
-      self.writer.write(container.gethtml())
+      container.writehtml(self.writer)
     self.writer.close()
 
 class TOCBasket(Basket):
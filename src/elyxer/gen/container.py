@@ -28,6 +28,7 @@ from elyxer.parse.parser import *
 from elyxer.out.output import *
 from elyxer.conf.config import *
 from elyxer.parse.position import *
+from elyxer.util.escape import *
 
 
 class Container(object):
@@ -46,50 +47,34 @@ class Container(object):
 
   def gethtml(self):
     "Get the resulting HTML"
-    html = self.output.gethtml(self)
-    if isinstance(html, basestring):
-      Trace.error('Raw string ' + html)
-      html = [html]
+    html = []
+    self.emithtml(html)
     return self.escapeall(html)
 
+  def emithtml(self, html):
+    "Emit the HTML code, not yet escaped, into a list or sink."
+    self.output.emithtml(self, html)
+
+  def writehtml(self, writer):
+    "Write the resulting HTML to a line writer as it is emitted."
+    sink = HTMLSink(self, writer)
+    self.emithtml(sink)
+    sink.flush()
+
   def escapeall(self, lines):
     "Escape all lines in an array according to the output options."
-    result = []
-    for line in lines:
-      if Options.html:
-        line = self.escape(line, EscapeConfig.html)
-      if Options.iso885915:
-        line = self.escape(line, EscapeConfig.iso885915)
-        line = self.escapeentities(line)
-      elif not Options.unicode:
-        line = self.escape(line, EscapeConfig.nonunicode)
-      result.append(line)
-    return result
+    escaper = Escaper.getoutput()
+    if Options.iso885915:
+      return [self.escapeentities(escaper.escape(line)) for line in lines]
+    return [escaper.escape(line) for line in lines]
 
   def escape(self, line, replacements = EscapeConfig.entities):
     "Escape a line with replacements from elyxer.a map"
-    pieces = replacements.keys()
-    # do them in order
-    pieces.sort()
-    for piece in pieces:
-      if piece in line:
-        line = line.replace(piece, replacements[piece])
-    return line
+    return Escaper.getmap(replacements).escape(line)
 
   def escapeentities(self, line):
     "Escape all Unicode characters to HTML entities."
-    result = ''
-    pos = TextPosition(line)
-    while not pos.finished():
-      if ord(pos.current()) > 128:
-        codepoint = hex(ord(pos.current()))
-        if codepoint == '0xd835':
-          codepoint = hex(ord(pos.next()) + 0xf800)
-        result += '&#' + codepoint[1:] + ';'
-      else:
-        result += pos.current()
-      pos.skipcurrent()
-    return result
+    return EntityEscaper.instance.escape(line)
 
   def searchall(self, type):
     "Search for all embedded containers of a given type"
@@ -203,6 +188,34 @@ class LyXFormat(BlackBox):
     if version > int(GeneralConfig.version['lyxformat']):
       Trace.error('Warning: unsupported new format version ' + str(version))
 
+class HTMLSink(object):
+  "Receives the HTML code emitted by a container and writes it, escaped."
+  "Lines are kept in a small buffer, so they are escaped and written in bulk."
+
+  size = 1000
+
+  def __init__(self, container, writer):
+    self.container = container
+    self.writer = writer
+    self.lines = []
+
+  def append(self, line):
+    "Receive a single line."
+    self.lines.append(line)
+    if len(self.lines) >= self.size:
+      self.flush()
+
+  def extend(self, lines):
+    "Receive a list of lines."
+    self.lines.extend(lines)
+    if len(self.lines) >= self.size:
+      self.flush()
+
+  def flush(self):
+    "Escape and write all lines received so far."
+    self.writer.write(self.container.escapeall(self.lines))
+    self.lines = []
+
 class StringContainer(Container):
   "A container for a single string"
 
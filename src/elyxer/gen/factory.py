@@ -65,7 +65,7 @@ class ContainerFactory(object):
   def createcontainer(self, reader):
     "Parse a single container."
     #Trace.debug('processing "' + reader.currentline().strip() + '"')
-    if reader.currentline() == '':
+    if reader.currenttoken().kind == LyXToken.empty:
       reader.nextline()
       return None
     container = Cloner.create(self.tree.find(reader))
@@ -77,7 +77,7 @@ class ContainerFactory(object):
     "Parse a container"
     parser = container.parser
     parser.parent = container
-    parser.ending = self.getending(container)
+    parser.ending = self.getending(container, reader.currenttoken())
     parser.factory = self
     container.header = parser.parseheader(reader)
     container.begin = parser.begin
@@ -95,12 +95,11 @@ class ContainerFactory(object):
     else:
       container.contents = contents
 
-  def getending(self, container):
-    "Get the ending for a container"
-    split = container.start.split()
-    if len(split) == 0:
+  def getending(self, container, token):
+    "Get the ending for a container, given its start token."
+    if token.first == '':
       return None
-    start = split[0]
+    start = token.first
     if start in ContainerConfig.startendings:
       return ContainerConfig.startendings[start]
     classname = container.__class__.__name__
@@ -112,30 +111,65 @@ class ContainerFactory(object):
     return None
 
 class ParseTree(object):
-  "A parsing tree"
+  "A parsing tree, compiled into a dispatch table on the first word."
+  "Starts that share their first word are matched deeper in the tree."
 
   default = '~~default~~'
 
   def __init__(self, types):
     "Create the parse tree"
     self.root = dict()
+    self.depth = 0
     for start, type in types.iteritems():
       self.addstart(type, start)
+    self.dispatch = self.compile()
+    self.initials = set([piece[0] for piece in self.dispatch])
 
   def addstart(self, type, start):
     "Add a start piece to the tree"
     tree = self.root
-    for piece in start.split():
+    pieces = start.split()
+    for piece in pieces:
       if not piece in tree:
         tree[piece] = dict()
       tree = tree[piece]
     if ParseTree.default in tree:
       Trace.error('Start ' + start + ' duplicated')
     tree[ParseTree.default] = type
+    self.depth = max(self.depth, len(pieces))
+
+  def compile(self):
+    "Compile the first level of the tree into a dispatch table."
+    "Unambiguous first words point directly to their type, the rest to None."
+    dispatch = dict()
+    for piece, branch in self.root.iteritems():
+      if piece == ParseTree.default:
+        continue
+      if len(branch) == 1 and ParseTree.default in branch:
+        dispatch[piece] = branch[ParseTree.default]
+      else:
+        dispatch[piece] = None
+    return dispatch
 
   def find(self, reader):
     "Find the current sentence in the tree"
-    branches = self.matchline(reader.currentline())
+    return self.findline(reader.currentline())
+
+  def findline(self, line):
+    "Find the type for a line: first in the dispatch table, then in the tree."
+    if line == '' or not line[0] in self.initials:
+      return self.root[ParseTree.default]
+    first = line.split(' ', 1)[0].rstrip('>')
+    if not first in self.dispatch:
+      return self.root[ParseTree.default]
+    type = self.dispatch[first]
+    if type:
+      return type
+    return self.findpieces(line.split(' ', self.depth)[:self.depth])
+
+  def findpieces(self, pieces):
+    "Find the type for some pieces, going as deep as possible in the tree."
+    branches = self.matchpieces(pieces)
     while not ParseTree.default in branches[-1]:
       branches.pop()
     last = branches[-1]
@@ -143,8 +177,12 @@ class ParseTree(object):
 
   def matchline(self, line):
     "Match a given line against the tree, as deep as possible."
+    return self.matchpieces(line.split(' '))
+
+  def matchpieces(self, pieces):
+    "Match some pieces against the tree, as deep as possible."
     branches = [self.root]
-    for piece in line.split(' '):
+    for piece in pieces:
       current = branches[-1]
       piece = piece.rstrip('>')
       if piece in current:
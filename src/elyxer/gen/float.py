@@ -31,6 +31,7 @@ from elyxer.gen.image import *
 from elyxer.ref.label import *
 from elyxer.ref.partkey import *
 from elyxer.proc.postprocess import *
+from elyxer.util.context import *
 
 
 class Float(Container):
@@ -100,12 +101,11 @@ class Float(Container):
     image = images[0]
     if not image.size:
       return
-    width = image.size.removepercentwidth()
+    width = image.size.getpercentwidth()
     if not width:
       return
-    image.type = 'figure'
     ContainerSize().setmax(width).addstyle(container)
-    image.settag()
+    image.apply(image.setfigure)
 
   def searchinside(self, type):
     "Search for a given type in the contents"
@@ -270,3 +270,5 @@ class PostWrap(PostFloat):
 
 Postprocessor.stages += [PostFloat, PostWrap]
 
+ConversionContext.register(Listing, 'processor', InitialValue(None).create)
+
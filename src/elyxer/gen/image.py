@@ -23,14 +23,19 @@
 # eLyXer image treatment
 
 import struct
+import re
 import sys
 import os
 import shutil
+import subprocess
+import codecs
+import tempfile
 from elyxer.util.trace import Trace
 from elyxer.util.translate import *
 from elyxer.gen.container import *
 from elyxer.gen.size import *
 from elyxer.io.path import *
+from elyxer.util.context import *
 
 
 class Image(Container):
@@ -39,6 +44,7 @@ class Image(Container):
   defaultformat = ImageConfig.formats['default']
   size = None
   copy = None
+  job = None
 
   def __init__(self):
     self.parser = InsetParser()
@@ -50,12 +56,35 @@ class Image(Container):
     self.origin = InputPath(self.getparameter('filename'))
     self.destination = self.getdestination(self.origin)
     self.size = ContainerSize().readparameters(self)
+    self.actions = []
     if self.origin.exists():
-      ImageConverter.instance.convert(self)
+      self.job = ImageConverter.instance.convert(self)
     else:
       Trace.error('Image ' + unicode(self.origin) + ' not found')
-    self.setsize()
-    self.settag()
+    self.apply(self.setsize)
+    self.apply(self.settag)
+
+  def apply(self, action):
+    "Apply an action on the image, or keep it until the conversion finishes."
+    if self.job:
+      self.actions.append(action)
+    else:
+      action()
+
+  def complete(self):
+    "Wait for the conversion to finish, and apply all pending actions."
+    if not self.job:
+      return
+    ImageConverter.queue.wait(self.job)
+    self.job = None
+    for action in self.actions:
+      action()
+    self.actions = []
+
+  def emithtml(self, html):
+    "Emit the HTML code once the image is converted."
+    self.complete()
+    Container.emithtml(self, html)
 
   def getdestination(self, origin):
     "Convert origin path to destination path."
@@ -89,6 +118,12 @@ class Image(Container):
     scaled = value * int(self.size.scale) / 100
     return unicode(int(scaled)) + 'px'
 
+  def setfigure(self):
+    "Set the image as a figure, with the percent width at the figure level."
+    self.size.removepercentwidth()
+    self.type = 'figure'
+    self.settag()
+
   def settag(self):
     "Set the output tag for the image."
     tag = 'img class="' + self.type + '"'
@@ -116,13 +151,24 @@ class ImageConverter(object):
   instance = None
 
   def convert(self, image):
-    "Convert an image to PNG"
+    "Convert an image to PNG."
+    "If conversions run in parallel, return the job; otherwise None."
     if not ImageConverter.active or Options.noconvert:
       return
     if image.origin.path == image.destination.path:
       return
+    if ImageConverter.queue.find(image.destination):
+      return ImageConverter.queue.find(image.destination)
+    entry = None
+    if Options.imagemanifest and not Options.copyimages:
+      entry = self.getentry(image)
     if image.destination.exists():
-      if image.origin.getmtime() <= image.destination.getmtime():
+      if entry and ImageManifest.getmanifest().has(image.destination):
+        if ImageManifest.getmanifest().matches(image.destination, entry):
+          # converted before from the same source and settings
+          self.descale(image)
+          return
+      elif image.origin.getmtime() <= image.destination.getmtime():
         # file has not changed; do not convert
         return
     image.destination.createdirs()
@@ -130,7 +176,13 @@ class ImageConverter(object):
       Trace.debug('Copying ' + image.origin.path + ' to ' + image.destination.path)
       shutil.copy2(image.origin.path, image.destination.path)
       return
+    if Options.batchconverter:
+      return self.addtobatch(image, entry)
     converter, command = self.buildcommand(image)
+    if Options.imagejobs:
+      job = ConversionJob(image, converter, command)
+      job.entry = entry
+      return ImageConverter.queue.add(job)
     try:
       Trace.debug(converter + ' command: "' + command + '"')
       result = os.system(command.encode(sys.getfilesystemencoding()))
@@ -138,6 +190,8 @@ class ImageConverter(object):
         Trace.error(converter + ' not installed; images will not be processed')
         ImageConverter.active = False
         return
+      if entry:
+        ImageManifest.getmanifest().recordimage(image.destination, entry)
       Trace.message('Converted ' + unicode(image.origin) + ' to ' +
           unicode(image.destination))
     except OSError, exception:
@@ -146,18 +200,86 @@ class ImageConverter(object):
 
   def buildcommand(self, image):
     "Build the command to convert the image."
-    if Options.converter in ImageConfig.converters:
-      command = ImageConfig.converters[Options.converter]
-    else:
-      command = Options.converter;
+    command = self.gettemplate()
     params = self.getparams(image)
     for param in params:
       command = command.replace('$' + param, unicode(params[param]))
+    self.descale(image)
     # remove unwanted options
     while '[' in command and ']' in command:
       command = self.removeparam(command)
     return Options.converter, command
 
+  def addtobatch(self, image, entry):
+    "Add the image to a batch with the same conversion settings."
+    command = self.getbatchtemplate()
+    params = self.getparams(image)
+    del params['input']
+    del params['output']
+    params['directory'] = os.path.dirname(image.destination.path) or '.'
+    params['extension'] = image.destination.getext()[1:]
+    for param in params:
+      command = command.replace('$' + param, unicode(params[param]))
+    self.descale(image)
+    while '[' in command and ']' in command:
+      command = self.removeparam(command)
+    return ImageConverter.queue.addtobatch(image, command, entry)
+
+  def getbatchtemplate(self):
+    "Get the template for the batch converter command."
+    if Options.batchconverter in ImageConfig.batchconverters:
+      return ImageConfig.batchconverters[Options.batchconverter]
+    return Options.batchconverter
+
+  def descale(self, image):
+    "Remove the scale of a vector image, since the converter scales it."
+    if image.origin.hasexts(self.vectorformats):
+      image.size.scale = None
+
+  def gettemplate(self):
+    "Get the template for the converter command."
+    if Options.converter in ImageConfig.converters:
+      return ImageConfig.converters[Options.converter]
+    return Options.converter
+
+  def getentry(self, image):
+    "Get the manifest entry for an image: a digest of the source file,"
+    "and a digest of the conversion settings (template, scale, format)."
+    settings = [self.gettemplate()]
+    if Options.batchconverter:
+      settings = [self.getbatchtemplate()]
+    params = self.getparams(image)
+    for name in sorted(params.keys()):
+      if not name in ['input', 'output']:
+        settings += [name, unicode(params[name])]
+    sha = self.newdigest()
+    for setting in settings:
+      sha.update(setting.encode('utf-8'))
+      sha.update('\0')
+    return (self.digestfile(image.origin), sha.hexdigest())
+
+  def digestfile(self, path):
+    "Get a digest of the contents of a file."
+    sha = self.newdigest()
+    file = open(path.path, 'rb')
+    try:
+      block = file.read(65536)
+      while block:
+        sha.update(block)
+        block = file.read(65536)
+    finally:
+      file.close()
+    return sha.hexdigest()
+
+  def newdigest(self):
+    "Create a new SHA-1 digest, only needed for the image manifest."
+    try:
+      from hashlib import sha1
+    except ImportError:
+      # Python 2.4
+      from sha import new as sha1
+    return sha1()
+
   def removeparam(self, command):
     "Remove an unwanted param."
     if command.index('[') > command.index(']'):
@@ -179,8 +301,6 @@ class ImageConverter(object):
       scale = 100
       if image.size.scale:
         scale = image.size.scale
-        # descale
-        image.size.scale = None
       params['scale'] = scale
     if image.origin.getext() in self.cropboxformats:
       params['format'] = self.cropboxformats[image.origin.getext()]
@@ -188,31 +308,418 @@ class ImageConverter(object):
 
 ImageConverter.instance = ImageConverter()
 
+class ConversionJob(object):
+  "The conversion of an image, as a separate process."
+
+  def __init__(self, image, converter, command):
+    self.origin = image.origin
+    self.destination = image.destination
+    self.converter = converter
+    self.command = command
+    self.entry = None
+    self.process = None
+    self.done = False
+
+  def start(self):
+    "Start the conversion process."
+    if not ImageConverter.active:
+      self.done = True
+      return
+    Trace.debug(self.converter + ' command: "' + self.command + '"')
+    try:
+      command = self.command.encode(sys.getfilesystemencoding())
+      self.process = subprocess.Popen(command, shell=True)
+    except OSError, exception:
+      Trace.error('Error while converting image ' + unicode(self.origin)
+          + ': ' + unicode(exception))
+      self.done = True
+
+  def wait(self):
+    "Wait for the process and check the result."
+    result = self.process.wait()
+    self.done = True
+    if result != 0:
+      if ImageConverter.active:
+        Trace.error(self.converter + ' not installed; images will not be processed')
+      ImageConverter.active = False
+      return
+    if self.entry:
+      ImageManifest.getmanifest().recordimage(self.destination, self.entry)
+    Trace.message('Converted ' + unicode(self.origin) + ' to ' +
+        unicode(self.destination))
+
+class ConversionBatch(ConversionJob):
+  "The conversion of many images with a single command, as one process."
+  "All images share the same settings and destination directory;"
+  "the command receives all inputs in $inputs, and places each output"
+  "in the directory with the same name and the new extension."
+
+  maxsize = 50
+  # exit code of the shell for a command not found
+  notfound = 127
+
+  def __init__(self, command):
+    self.converter = Options.batchconverter
+    self.template = command
+    self.command = None
+    self.images = []
+    self.entries = []
+    self.process = None
+    self.done = False
+    self.closed = False
+    self.origin = None
+
+  def add(self, image, entry):
+    "Add an image to the batch."
+    self.images.append(image)
+    self.entries.append(entry)
+    if not self.origin:
+      self.origin = image.origin
+
+  def isfull(self):
+    "Find out if the batch cannot take any more images."
+    return len(self.images) >= self.maxsize
+
+  def close(self):
+    "Close the batch and build the final command."
+    inputs = ['"' + unicode(image.origin) + '"' for image in self.images]
+    self.command = self.template.replace('$inputs', ' '.join(inputs))
+    self.closed = True
+
+  def start(self):
+    "Start the batch; if the command cannot be run, stop converting images."
+    ConversionJob.start(self)
+    if self.done:
+      self.disable()
+
+  def wait(self):
+    "Wait for the process and check the result for each image."
+    "The command may fail for some images and still convert the rest."
+    result = self.process.wait()
+    self.done = True
+    if result == self.notfound:
+      self.disable()
+      return
+    if result != 0:
+      Trace.error(self.converter + ' exited with code ' + unicode(result)
+          + ' in a batch of ' + unicode(len(self.images)) + ' images')
+    for image, entry in zip(self.images, self.entries):
+      if not image.destination.exists():
+        Trace.error('Batch conversion did not produce ' + unicode(image.destination))
+        continue
+      if entry:
+        ImageManifest.getmanifest().recordimage(image.destination, entry)
+      Trace.message('Converted ' + unicode(image.origin) + ' to ' +
+          unicode(image.destination))
+
+  def disable(self):
+    "Report that the converter is not installed, and stop converting images."
+    if ImageConverter.active:
+      Trace.error(self.converter + ' not installed; images will not be processed')
+    ImageConverter.active = False
+
+class ConversionQueue(object):
+  "A queue of image conversions, run in parallel on a pool of processes."
+  "Parsing goes on while images are converted; each image waits for its"
+  "own conversion when it is output."
+
+  def __init__(self):
+    self.jobs = dict()
+    self.batches = dict()
+    self.waiting = []
+    self.running = []
+
+  def add(self, job):
+    "Add a job to the queue, and start as many jobs as possible."
+    self.jobs[job.destination.path] = job
+    self.waiting.append(job)
+    self.reap()
+    self.startjobs()
+    return job
+
+  def addtobatch(self, image, command, entry):
+    "Add an image to the open batch for a command; it is run once full."
+    if not command in self.batches:
+      self.batches[command] = ConversionBatch(command)
+    batch = self.batches[command]
+    batch.add(image, entry)
+    self.jobs[image.destination.path] = batch
+    if batch.isfull():
+      self.closebatch(batch)
+    return batch
+
+  def closebatch(self, batch):
+    "Close a batch and queue it to run."
+    del self.batches[batch.template]
+    batch.close()
+    self.waiting.append(batch)
+    self.reap()
+    self.startjobs()
+
+  def find(self, destination):
+    "Find a pending job for a given destination."
+    if not destination.path in self.jobs:
+      return None
+    job = self.jobs[destination.path]
+    if job.done:
+      return None
+    return job
+
+  def startjobs(self):
+    "Start waiting jobs while there are free processes."
+    while len(self.waiting) > 0 and len(self.running) < self.getjobs():
+      job = self.waiting.pop(0)
+      job.start()
+      if not job.done:
+        self.running.append(job)
+
+  def getjobs(self):
+    "Get the number of processes to run at the same time."
+    if not Options.imagejobs:
+      return 1
+    return Options.imagejobs
+
+  def reap(self):
+    "Check all running jobs, and finish those already done."
+    for job in list(self.running):
+      if job.process.poll() != None:
+        self.finish(job)
+
+  def finish(self, job):
+    "Wait for a running job to finish."
+    self.running.remove(job)
+    job.wait()
+
+  def wait(self, job):
+    "Wait until a job is done, running others in the meantime."
+    if isinstance(job, ConversionBatch) and not job.closed:
+      self.closebatch(job)
+    while not job.done:
+      self.startjobs()
+      if len(self.running) == 0:
+        return
+      if job in self.running:
+        self.finish(job)
+      else:
+        self.finish(self.running[0])
+
+  def waitall(self):
+    "Wait until all jobs are done."
+    for batch in self.batches.values():
+      self.closebatch(batch)
+    for job in self.jobs.values():
+      self.wait(job)
+    self.jobs = dict()
+
+ImageConverter.queue = ConversionQueue()
+
+class ImageStore(object):
+  "A file with one line per image, kept across runs."
+  "Each line has tab-separated fields, the first one being the key."
+  "New entries are merged into the file when saving, keeping entries"
+  "written meanwhile by other runs; the file is written under a temporary"
+  "name and then renamed."
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = self.read()
+    self.recorded = dict()
+
+  def get(self, key):
+    "Get the values for a key, or None."
+    if not key in self.entries:
+      return None
+    return self.entries[key]
+
+  def record(self, key, values):
+    "Record the values for a key."
+    self.entries[key] = values
+    self.recorded[key] = values
+
+  def read(self):
+    "Read all entries in the file."
+    entries = dict()
+    if not os.path.exists(self.path):
+      return entries
+    try:
+      file = codecs.open(self.path, 'rU', 'utf-8')
+      try:
+        for line in file:
+          pieces = line.rstrip('\n').split('\t')
+          if len(pieces) == self.fields:
+            entries[pieces[0]] = tuple(pieces[1:])
+      finally:
+        file.close()
+    except (IOError, UnicodeDecodeError):
+      Trace.debug('Unreadable file ' + self.path)
+    return entries
+
+  def save(self):
+    "Merge the recorded entries into the file."
+    if len(self.recorded) == 0:
+      return
+    entries = self.read()
+    entries.update(self.recorded)
+    try:
+      directory = os.path.dirname(os.path.abspath(self.path))
+      handle, temporary = tempfile.mkstemp(dir = directory)
+      file = os.fdopen(handle, 'wb')
+      try:
+        for key in sorted(entries.keys()):
+          line = '\t'.join([key] + list(entries[key])) + '\n'
+          file.write(line.encode('utf-8'))
+      finally:
+        file.close()
+      if os.name == 'nt' and os.path.exists(self.path):
+        os.remove(self.path)
+      os.rename(temporary, self.path)
+    except (IOError, OSError):
+      Trace.debug('Cannot write ' + self.path + ': ' + unicode(sys.exc_info()[1]))
+    self.recorded = dict()
+
+class ImageManifest(ImageStore):
+  "A manifest of the images converted into a destination directory."
+  "For each image it keeps a digest of the source and of the conversion"
+  "settings, so that conversion can be skipped if neither has changed,"
+  "whatever the modification times say."
+
+  filename = '.elyxer-images'
+  fields = 3
+  manifests = dict()
+
+  def __init__(self, directory):
+    ImageStore.__init__(self, os.path.join(directory, self.filename))
+
+  def has(self, destination):
+    "Find out if there is an entry for a destination image."
+    return self.get(destination.url) != None
+
+  def matches(self, destination, entry):
+    "Find out if the entry for a destination image matches the given one."
+    return self.get(destination.url) == entry
+
+  def recordimage(self, destination, entry):
+    "Record the entry for a converted image."
+    self.record(destination.url, entry)
+
+  def getmanifest(cls):
+    "Get the manifest for the current destination directory."
+    if not Options.destdirectory in cls.manifests:
+      cls.manifests[Options.destdirectory] = ImageManifest(Options.destdirectory)
+    return cls.manifests[Options.destdirectory]
+
+  def saveall(cls):
+    "Save all manifests used."
+    for manifest in cls.manifests.values():
+      manifest.save()
+
+  getmanifest = classmethod(getmanifest)
+  saveall = classmethod(saveall)
+
+class DimensionCache(ImageStore):
+  "A cache of image dimensions, in the file given by --dimensioncache."
+  "Entries are keyed by absolute path, and valid while the size"
+  "and modification time of the file stay the same."
+
+  fields = 5
+  cache = None
+
+  def getdimensions(self, path):
+    "Get the cached dimensions for a path, or None if not valid."
+    values = self.get(os.path.abspath(path.path))
+    if not values or values[:2] != self.getstamp(path):
+      return None
+    return (self.readvalue(values[2]), self.readvalue(values[3]))
+
+  def recorddimensions(self, path, dimensions):
+    "Record the dimensions for a path."
+    width, height = dimensions
+    values = self.getstamp(path) + (self.writevalue(width), self.writevalue(height))
+    self.record(os.path.abspath(path.path), values)
+
+  def getstamp(self, path):
+    "Get the size and modification time of a file, as strings."
+    return (unicode(os.path.getsize(path.path)), repr(path.getmtime()))
+
+  def readvalue(self, value):
+    "Read a dimension, which may be empty."
+    if value == '':
+      return None
+    return int(value)
+
+  def writevalue(self, value):
+    "Write a dimension, which may be None."
+    if value == None:
+      return ''
+    return unicode(value)
+
+  def getcache(cls):
+    "Get the dimension cache, if there is one."
+    if not Options.dimensioncache:
+      return None
+    if not cls.cache:
+      cls.cache = DimensionCache(Options.dimensioncache)
+    return cls.cache
+
+  def savecache(cls):
+    "Save the dimension cache, if used."
+    if cls.cache:
+      cls.cache.save()
+
+  getcache = classmethod(getcache)
+  savecache = classmethod(savecache)
+
 class ImageFile(object):
-  "A file corresponding to an image (JPG or PNG)"
+  "A file corresponding to an image (PNG, JPG, GIF, BMP, WebP, SVG or PDF)"
+  "Dimensions are read from the file headers, without decoding the image."
 
   dimensions = dict()
+  svgunits = {
+      'px':1.0, 'pt':4.0/3, 'pc':16.0, 'mm':96/25.4, 'cm':96/2.54, 'in':96.0,
+      '':1.0
+      }
+  svgchunk = 4096
+  pdfchunk = 65536
 
   def __init__(self, path):
     "Create the file based on its path"
     self.path = path
 
   def getdimensions(self):
-    "Get the dimensions of a JPG or PNG image"
+    "Get the dimensions of an image, in pixels"
     if not self.path.exists():
       return None, None
     if unicode(self.path) in ImageFile.dimensions:
       return ImageFile.dimensions[unicode(self.path)]
-    dimensions = (None, None)
-    if self.path.hasext('.png'):
-      dimensions = self.getpngdimensions()
-    elif self.path.hasext('.jpg'):
-      dimensions = self.getjpgdimensions()
-    elif self.path.hasext('.svg'):
-      dimensions = self.getsvgdimensions()
+    cache = DimensionCache.getcache()
+    dimensions = None
+    if cache:
+      dimensions = cache.getdimensions(self.path)
+    if not dimensions:
+      dimensions = self.probedimensions()
+      if cache:
+        cache.recorddimensions(self.path, dimensions)
     ImageFile.dimensions[unicode(self.path)] = dimensions
     return dimensions
 
+  def probedimensions(self):
+    "Read the dimensions of an image from its headers"
+    if self.path.hasext('.png'):
+      return self.getpngdimensions()
+    if self.path.hasext('.jpg') or self.path.hasext('.jpeg'):
+      return self.getjpgdimensions()
+    if self.path.hasext('.gif'):
+      return self.getgifdimensions()
+    if self.path.hasext('.bmp'):
+      return self.getbmpdimensions()
+    if self.path.hasext('.webp'):
+      return self.getwebpdimensions()
+    if self.path.hasext('.svg'):
+      return self.getsvgdimensions()
+    if self.path.hasext('.pdf'):
+      return self.getpdfdimensions()
+    return (None, None)
+
   def getpngdimensions(self):
     "Get the dimensions of a PNG image"
     pngfile = self.path.open()
@@ -236,10 +743,149 @@ class ImageFile(object):
     jpgfile.close()
     return (width, height)
 
-  def getsvgdimensions(self):
-    "Get the dimensions of a SVG image."
+  def getgifdimensions(self):
+    "Get the dimensions of a GIF image: two little-endian words after the signature"
+    giffile = self.path.open()
+    header = giffile.read(10)
+    giffile.close()
+    if len(header) < 10 or not header[:6] in ['GIF87a', 'GIF89a']:
+      Trace.error(unicode(self.path) + ' not a GIF file')
+      return (None, None)
+    return struct.unpack('<HH', header[6:10])
+
+  def getbmpdimensions(self):
+    "Get the dimensions of a BMP image from its info header"
+    bmpfile = self.path.open()
+    header = bmpfile.read(26)
+    bmpfile.close()
+    if len(header) < 26 or header[:2] != 'BM':
+      Trace.error(unicode(self.path) + ' not a BMP file')
+      return (None, None)
+    size = struct.unpack('<L', header[14:18])[0]
+    if size == 12:
+      return struct.unpack('<HH', header[18:22])
+    width, height = struct.unpack('<ll', header[18:26])
+    return (width, abs(height))
+
+  def getwebpdimensions(self):
+    "Get the dimensions of a WebP image, in any of its three flavors"
+    webpfile = self.path.open()
+    header = webpfile.read(30)
+    webpfile.close()
+    if len(header) < 30 or header[:4] != 'RIFF' or header[8:12] != 'WEBP':
+      Trace.error(unicode(self.path) + ' not a WebP file')
+      return (None, None)
+    chunk = header[12:16]
+    if chunk == 'VP8 ':
+      width, height = struct.unpack('<HH', header[26:30])
+      return (width & 0x3fff, height & 0x3fff)
+    if chunk == 'VP8L':
+      bits = struct.unpack('<L', header[21:25])[0]
+      return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+    if chunk == 'VP8X':
+      width = struct.unpack('<L', header[24:27] + '\0')[0]
+      height = struct.unpack('<L', header[27:30] + '\0')[0]
+      return (width + 1, height + 1)
+    Trace.error('Unknown WebP chunk ' + repr(chunk) + ' in ' + unicode(self.path))
     return (None, None)
 
+  def getsvgdimensions(self):
+    "Get the dimensions of a SVG image from its width and height attributes,"
+    "or else from its viewBox; only the start tag is read."
+    tag = self.readsvgtag()
+    if not tag:
+      return (None, None)
+    width = self.readsvglength(self.getsvgattribute(tag, 'width'))
+    height = self.readsvglength(self.getsvgattribute(tag, 'height'))
+    if width != None and height != None:
+      return (width, height)
+    viewbox = self.getsvgattribute(tag, 'viewBox')
+    if not viewbox:
+      return (width, height)
+    values = viewbox.replace(',', ' ').split()
+    if len(values) != 4:
+      return (width, height)
+    try:
+      boxwidth = float(values[2])
+      boxheight = float(values[3])
+    except ValueError:
+      return (width, height)
+    if boxwidth <= 0 or boxheight <= 0:
+      return (width, height)
+    if width != None:
+      return (width, int(round(width * boxheight / boxwidth)))
+    if height != None:
+      return (int(round(height * boxwidth / boxheight)), height)
+    return (int(round(boxwidth)), int(round(boxheight)))
+
+  def readsvgtag(self):
+    "Read the start tag of the svg element, or None if not found."
+    svgfile = self.path.open()
+    contents = ''
+    start = -1
+    while True:
+      read = svgfile.read(self.svgchunk)
+      contents += read
+      if start < 0:
+        match = re.search('<svg[\\s>]', contents)
+        if match:
+          start = match.start()
+      if start >= 0:
+        end = contents.find('>', start)
+        if end >= 0:
+          svgfile.close()
+          return contents[start:end + 1]
+      if read == '' or len(contents) > 16 * self.svgchunk:
+        svgfile.close()
+        Trace.error('No svg element in ' + unicode(self.path))
+        return None
+
+  def getsvgattribute(self, tag, name):
+    "Get the value of an attribute in a tag, or None."
+    match = re.search('\\s' + name + '\\s*=\\s*("([^"]*)"|\'([^\']*)\')', tag)
+    if not match:
+      return None
+    if match.group(2) != None:
+      return match.group(2)
+    return match.group(3)
+
+  def readsvglength(self, value):
+    "Read a SVG length and convert it to pixels; None for relative lengths."
+    if not value:
+      return None
+    match = re.match('\\s*([0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\\s*([a-z]*)\\s*$', value)
+    if not match or not match.group(2) in self.svgunits:
+      return None
+    return int(round(float(match.group(1)) * self.svgunits[match.group(2)]))
+
+  def getpdfdimensions(self):
+    "Get the dimensions of the first MediaBox in a PDF file, in pixels;"
+    "the box is looked for at the start and at the end of the file."
+    pdffile = self.path.open()
+    contents = pdffile.read(self.pdfchunk)
+    if not contents.startswith('%PDF'):
+      pdffile.close()
+      Trace.error(unicode(self.path) + ' not a PDF file')
+      return (None, None)
+    dimensions = self.findmediabox(contents)
+    if not dimensions:
+      pdffile.seek(0, 2)
+      pdffile.seek(max(pdffile.tell() - self.pdfchunk, 0))
+      dimensions = self.findmediabox(pdffile.read(self.pdfchunk))
+    pdffile.close()
+    if not dimensions:
+      return (None, None)
+    return dimensions
+
+  def findmediabox(self, contents):
+    "Find a MediaBox in some contents, and return its dimensions in pixels."
+    number = '\\s*(-?[0-9]*\\.?[0-9]+)'
+    match = re.search('/MediaBox\\s*\\[' + number * 4 + '\\s*\\]', contents)
+    if not match:
+      return None
+    x0, y0, x1, y1 = [float(value) for value in match.groups()]
+    return (int(round(abs(x1 - x0) * 4 / 3)), int(round(abs(y1 - y0) * 4 / 3)))
+
   def skipheaders(self, file, hexvalues):
     "Skip JPEG headers until one of the parameter headers is found"
     headervalues = [int(value, 16) for value in hexvalues]
@@ -275,3 +921,5 @@ class ImageFile(object):
     "Seek forward, just by reading the given number of bytes"
     file.read(bytes)
 
+ConversionContext.register(ImageFile, 'dimensions', dict)
+ConversionContext.register(ImageManifest, 'manifests', dict)
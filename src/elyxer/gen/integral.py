@@ -23,11 +23,15 @@
 # eLyXer integral processing
 # http://www.nongnu.org/elyxer/
 
+import os
+import tempfile
+from elyxer.io.fileline import *
 from elyxer.gen.layout import *
 from elyxer.gen.float import *
 from elyxer.ref.index import *
 from elyxer.bib.biblio import *
 from elyxer.gen.basket import *
+from elyxer.util.context import *
 
 
 class IntegralProcessor(object):
@@ -172,3 +176,317 @@ class MemoryBasket(KeeperBasket):
       if processor.locate(container):
         processor.store(container)
 
+class SpilledPart(object):
+  "A part of the document already written to a spill file."
+
+  def __init__(self, file, start):
+    self.file = file
+    self.start = start
+    self.end = start
+
+  def locateprocess(self, locate, process):
+    "A spilled part has nothing left to locate."
+    pass
+
+  def writehtml(self, writer):
+    "Copy the spilled HTML to a line writer."
+    self.file.seek(self.start)
+    writer.write([self.file.read(self.end - self.start).decode('utf-8')])
+
+class SpillBasket(MemoryBasket):
+  "A memory basket which keeps within a memory budget, in megabytes."
+  "Once the budget is exceeded, containers that no integral processor will touch"
+  "are written to a spill file and detached; the rest stay in memory"
+  "and are processed at the end, as in a memory basket."
+
+  partsize = 1024 * 1024
+
+  def __init__(self, budget):
+    MemoryBasket.__init__(self)
+    self.budget = budget
+    self.exceeded = False
+    self.pending = None
+    self.spill = None
+
+  def write(self, container):
+    "Store the pending container and keep the new one,"
+    "since postprocessing may still change it."
+    if self.pending:
+      self.store(self.pending)
+    self.pending = container
+
+  def finish(self):
+    "Store the last container, then process everything and write to disk."
+    if self.pending:
+      self.store(self.pending)
+    self.pending = None
+    MemoryBasket.finish(self)
+
+  def store(self, container):
+    "Keep a container in memory, or spill it if over budget."
+    if not self.overbudget() or self.islive(container):
+      self.contents.append(container)
+      return
+    self.spillcontainer(container)
+
+  def overbudget(self):
+    "Find out if the memory budget has been exceeded. Once it is, it stays so."
+    if self.exceeded:
+      return True
+    used = self.usedmemory()
+    if used == None:
+      Trace.message('Cannot measure memory used; spilling to disk')
+      self.exceeded = True
+    elif used > self.budget:
+      Trace.message('Memory budget of ' + unicode(self.budget) + ' MB exceeded; spilling to disk')
+      self.exceeded = True
+    return self.exceeded
+
+  def usedmemory(self):
+    "Get the memory used by the process in megabytes, None if not known."
+    try:
+      resident = int(open('/proc/self/statm').read().split()[1])
+      return resident * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (IOError, OSError, ValueError, AttributeError):
+      return None
+
+  def islive(self, container):
+    "Find out if a container or any of its elements must stay in memory."
+    if self.keeplive(container):
+      return True
+    live = []
+    container.locateprocess(self.keeplive, live.append)
+    return len(live) > 0
+
+  def keeplive(self, container):
+    "Integral containers stay in memory; also cites, filled in with their entries."
+    return self.integrallocate(container) or isinstance(container, BiblioCite)
+
+  def spillcontainer(self, container):
+    "Write a container to the spill file and detach it."
+    if not self.spill:
+      descriptor, self.spillname = tempfile.mkstemp('.html', 'elyxer-')
+      self.spill = BufferedLineWriter(os.fdopen(descriptor, 'w+b'))
+    if not self.continuespill():
+      self.contents.append(SpilledPart(self.spill.file, self.spill.file.tell()))
+    container.writehtml(self.spill)
+    self.spill.flush()
+    self.contents[-1].end = self.spill.file.tell()
+    for label in container.searchall(Label):
+      # keep the numbered container for references, since parents are lost
+      label.lastnumbered = label.numbered(label)
+    self.detach(container)
+
+  def continuespill(self):
+    "Find out if the last spilled part can take one more container."
+    if len(self.contents) == 0:
+      return False
+    last = self.contents[-1]
+    if not isinstance(last, SpilledPart):
+      return False
+    return last.end - last.start < self.partsize
+
+  def flush(self):
+    "Flush the contents to the writer and remove the spill file."
+    MemoryBasket.flush(self)
+    if self.spill:
+      self.spill.close()
+      os.remove(self.spillname)
+
+class DocumentIndex(object):
+  "A compact index of a document, collected in a first pass."
+  "Keeps just what is needed to resolve forward references in a second pass:"
+  "labels, TOC entries, floats by type, bibliography entries and the title."
+
+  title = None
+
+  def __init__(self):
+    self.labels = dict()
+    self.tocentries = []
+    self.floats = dict()
+    self.entries = dict()
+
+class IndexedLabel(object):
+  "A label in the document index: its anchor and its part key."
+  "Can be the destination of a link, just like the original label."
+
+  page = None
+
+  def __init__(self, label):
+    self.anchor = label.anchor
+    self.partkey = label.findpartkey()
+
+  def findpartkey(self):
+    "Get the part key for the label."
+    return self.partkey
+
+class PassBasket(Basket):
+  "A basket for one of the passes of a two-pass conversion."
+  "Each container is completed when the next one arrives, since postprocessing"
+  "may still change it; then it is detached from its elements, so that"
+  "elements kept elsewhere (labels, references, cites...) do not keep"
+  "the whole document alive."
+
+  def __init__(self):
+    self.index = DocumentIndex()
+    self.handlers = []
+    self.pending = None
+
+  def write(self, container):
+    "Complete the pending container and keep the new one."
+    if self.pending:
+      self.complete(self.pending)
+    self.pending = container
+
+  def finish(self):
+    "Complete the last container."
+    if self.pending:
+      self.complete(self.pending)
+    self.pending = None
+
+  def searchintegral(self, container):
+    "Handle all integral containers, in the same order as the MemoryBasket."
+    self.handle(container)
+    container.locateprocess(self.isintegral, self.handle)
+
+  def isintegral(self, container):
+    "Find out if a container has a handler."
+    for type, handler in self.handlers:
+      if isinstance(container, type):
+        return True
+    return False
+
+  def handle(self, container):
+    "Handle a container with all matching handlers."
+    for type, handler in self.handlers:
+      if isinstance(container, type):
+        handler(container)
+
+class IndexBasket(PassBasket):
+  "A basket for the first pass: index the document and write nothing."
+
+  def __init__(self):
+    PassBasket.__init__(self)
+    self.converter = TOCConverter()
+    self.listof = IntegralListOf()
+    self.handlers = [
+        (Label, self.indexlabel), (BiblioEntry, self.indexentry),
+        (Float, self.indexfloat),
+        ]
+
+  def complete(self, container):
+    "Index a container and let it go."
+    self.searchintegral(container)
+    self.indextoc(container)
+    self.detach(container)
+
+  def indextoc(self, container = None):
+    "Index the TOC entries for containers with a part key, in order,"
+    "as long as they are inside the given container (or all of them)."
+    partkeyed = PartKeyGenerator.partkeyed
+    while len(partkeyed) > 0 and self.isinside(partkeyed[0], container):
+      entry = self.converter.convert(partkeyed.pop(0))
+      if entry:
+        self.index.tocentries.append(entry)
+
+  def isinside(self, element, container):
+    "Find out if an element is inside a container; no container means all."
+    if not container:
+      return True
+    while element.parent:
+      element = element.parent
+    return element == container
+
+  def indexlabel(self, label):
+    "Index a label with its part key."
+    self.index.labels[label.key] = IndexedLabel(label)
+
+  def indexentry(self, entry):
+    "Index the number and the cite text for a bibliography entry."
+    number = NumberGenerator.generator.generate('integralbib')
+    self.index.entries[entry.key] = (number, entry.citeref)
+
+  def indexfloat(self, float):
+    "Index the TOC entry for a float by type."
+    if not float.type in self.index.floats:
+      self.index.floats[float.type] = []
+    entry = self.listof.processfloat(float)
+    if entry:
+      self.index.floats[float.type].append(entry)
+
+  def finish(self):
+    "Finish the index; there is nothing to write."
+    PassBasket.finish(self)
+    self.indextoc()
+    self.index.title = DocumentTitle.title
+
+class StreamBasket(PassBasket):
+  "A basket for the second pass: write each container as soon as it arrives,"
+  "resolving forward references with the index from the first pass."
+
+  def __init__(self):
+    PassBasket.__init__(self)
+    self.handlers = [
+        (TableOfContents, self.filltoc), (BiblioEntry, self.numberentry),
+        (BiblioCite, self.linkcite), (ListOf, self.filllistof),
+        (Reference, self.formatreference),
+        ]
+
+  def setindex(self, index):
+    "Set the index from the first pass."
+    "The title is needed right away, for the header."
+    self.index = index
+    DocumentTitle.title = index.title
+    return self
+
+  def complete(self, container):
+    "Complete a container with the index, write it and let it go."
+    self.searchintegral(container)
+    container.writehtml(self.writer)
+    self.detach(container)
+    # part keys are only needed for the TOC, which is in the index
+    del PartKeyGenerator.partkeyed[:]
+
+  def filltoc(self, toc):
+    "Fill in a table of contents with the entries in the index."
+    converter = TOCConverter()
+    for entry in self.index.tocentries:
+      toc.add(converter.indent(entry))
+    # finish off with the footer to align indents
+    toc.add(converter.convertindented(LyXFooter()))
+
+  def numberentry(self, entry):
+    "Number a bibliography entry."
+    IntegralBiblioEntry().processeach(entry)
+
+  def linkcite(self, cite):
+    "Link a cite to its bibliography entry, using the index."
+    if not cite.key in self.index.entries:
+      return
+    number, citeref = self.index.entries[cite.key]
+    cite.contents = citeref
+    cite.anchor = 'cite-' + number
+    cite.destination = Link().complete('cite', 'biblio-' + number, type='biblioentry')
+
+  def filllistof(self, listof):
+    "Fill in a list of floats with the entries in the index."
+    listof.output = TaggedOutput().settag('div class="fulltoc"', True)
+    if not listof.type in self.index.floats:
+      Trace.message('No floats of type ' + listof.type)
+      return
+    listof.contents += self.index.floats[listof.type]
+
+  def formatreference(self, reference):
+    "Format a reference to a label, using the index."
+    if reference.key in self.index.labels:
+      reference.destination = self.index.labels[reference.key]
+    reference.formatcontents()
+
+  def finish(self):
+    "Write the last container and close."
+    PassBasket.finish(self)
+    self.writer.close()
+
+ConversionContext.register(IntegralTOC, 'tocentries', list)
+ConversionContext.register(IntegralFloat, 'bytype', dict)
+
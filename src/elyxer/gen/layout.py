@@ -32,6 +32,7 @@ from elyxer.proc.postprocess import *
 from elyxer.ref.label import *
 from elyxer.ref.partkey import *
 from elyxer.ref.link import *
+from elyxer.util.context import *
 
 
 class Layout(Container):
@@ -317,20 +318,19 @@ class PostLyXCode(object):
   processedclass = LyXCode
 
   def postprocess(self, last, lyxcode, next):
-    "Coalesce if last was also LyXCode"
+    "Coalesce if last was also LyXCode."
+    "All contents are moved forward to the current layout, so that"
+    "previous layouts are not changed after the next one is done."
     if not isinstance(last, LyXCode):
       return lyxcode
-    if hasattr(last, 'first'):
-      lyxcode.first = last.first
-    else:
-      lyxcode.first = last
-    toappend = lyxcode.first.contents
-    toappend.append(Constant('\n'))
-    toappend += lyxcode.contents
-    lyxcode.output = EmptyOutput()
+    lyxcode.contents = last.contents + [Constant('\n')] + lyxcode.contents
+    last.contents = []
+    last.output = EmptyOutput()
     return lyxcode
 
 Postprocessor.stages += [
     PostLayout, PostStandard, PostLyXCode, PostPlainLayout
     ]
 
+ConversionContext.register(Abstract, 'done', InitialValue(False).create)
+
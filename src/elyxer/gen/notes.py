@@ -28,6 +28,7 @@ from elyxer.parse.parser import *
 from elyxer.out.output import *
 from elyxer.gen.container import *
 from elyxer.ref.link import *
+from elyxer.util.context import *
 
 
 class SideNote(Container):
@@ -150,3 +151,5 @@ class Note(Container):
       return
     self.output = TaggedOutput().settag(TagConfig.notes[self.type], True)
 
+ConversionContext.register(EndFootnotes, 'footnotes', list)
+
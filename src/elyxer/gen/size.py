@@ -117,13 +117,19 @@ class ContainerSize(object):
     scaled = value * int(self.scale) / 100
     return unicode(int(scaled)) + 'px'
 
-  def removepercentwidth(self):
-    "Remove percent width if present, to set it at the figure level."
+  def getpercentwidth(self):
+    "Get the width if it is a percent, None otherwise."
     if not self.width:
       return None
     if not '%' in self.width:
       return None
-    width = self.width
+    return self.width
+
+  def removepercentwidth(self):
+    "Remove percent width if present, to set it at the figure level."
+    width = self.getpercentwidth()
+    if not width:
+      return None
     self.width = None
     if self.height == 'auto':
       self.height = None
@@ -23,10 +23,11 @@
 # eLyXer split part processing
 # http://www.nongnu.org/elyxer/
 
-
+import os
 from elyxer.util.translate import *
 from elyxer.gen.basket import *
 from elyxer.gen.integral import *
+from elyxer.util.context import *
 
 
 class SplitPartLink(IntegralProcessor):
@@ -263,8 +264,48 @@ class SplitPartBasket(Basket):
   def finish(self):
     "Process the whole basket, split into page baskets and flush all of them."
     self.splitbaskets()
-    for basket in self.baskets:
-      basket.flush()
+    self.flushbaskets()
+
+  def flushbaskets(self):
+    "Flush all page baskets, on a pool of processes if requested."
+    "Processes are forked once all pages are linked, so they share all baskets;"
+    "each page is written to its own file, so the result does not depend on order."
+    pool = self.createpool()
+    if not pool:
+      for basket in self.baskets:
+        basket.flush()
+      return
+    for changed in pool.map(flushsplitpage, self.lastpages(), 1):
+      # writers in workers cannot count, so count here
+      if changed == True:
+        UpdateWriter.written += 1
+      elif changed == False:
+        UpdateWriter.skipped += 1
+    pool.close()
+    pool.join()
+
+  def createpool(self):
+    "Create a pool of processes to flush the pages, or None to flush serially."
+    "A pool needs fork and the multiprocessing module (from Python 2.6)."
+    if not Options.splitjobs or not hasattr(os, 'fork'):
+      return None
+    jobs = min(Options.splitjobs, len(self.baskets))
+    if jobs <= 1:
+      return None
+    try:
+      import multiprocessing
+    except ImportError:
+      Trace.debug('No multiprocessing module, writing split pages serially')
+      return None
+    return multiprocessing.Pool(jobs)
+
+  def lastpages(self):
+    "Get the indexes of the baskets to flush: when two parts have the same"
+    "file name only the last one is written, as when flushing serially."
+    pages = dict()
+    for index, basket in enumerate(self.baskets):
+      pages[basket.page] = index
+    return sorted(pages.values())
 
   def afterheader(self, container):
     "Find out if this is the header on the file."
@@ -277,7 +318,9 @@ class SplitPartBasket(Basket):
   def addbasket(self, filename, writer = None):
     "Add a new basket."
     if not writer:
-      writer = LineWriter(filename)
+      writer = BufferedLineWriter(filename, Options.buffersize)
+      if Options.onlychanged:
+        writer = UpdateWriter(filename, VariableMap().getvolatile())
     basket = SplitFileBasket()
     basket.setwriter(writer)
     self.baskets.append(basket)
@@ -318,3 +361,14 @@ class SplitTOCBasket(SplitPartBasket):
       tocbasket.write(container)
     tocbasket.finish()
 
+def flushsplitpage(index):
+  "Flush a page basket in a worker process."
+  "Return if the page changed, when only writing changed files."
+  basket = SplitPartBasket.baskets[index]
+  basket.flush()
+  if isinstance(basket.writer, UpdateWriter):
+    return basket.writer.changed
+  return None
+
+ConversionContext.register(SplitPartBasket, 'baskets', list)
+
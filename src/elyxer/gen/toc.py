@@ -27,6 +27,7 @@
 from elyxer.gen.header import *
 from elyxer.ref.label import *
 from elyxer.util.docparams import *
+from elyxer.util.context import *
 
 
 class TOCEntry(Container):
@@ -197,3 +198,6 @@ class TOCConverter(object):
     TOCConverter.tree.store(entry)
     return entry
 
+ConversionContext.register(TOCConverter, 'cache', dict)
+ConversionContext.register(TOCConverter, 'tree', TOCTree)
+
@@ -23,8 +23,15 @@
 # File line management for eLyXer
 
 import sys
+import os
+import re
+import stat
 import codecs
+import mmap
+import array
+import tempfile
 from elyxer.util.trace import Trace
+from elyxer.util.context import *
 
 
 class LineReader(object):
@@ -72,9 +79,7 @@ class LineReader(object):
 
   def readline(self):
     "Read a line from elyxer.file"
-    self.current = self.file.readline()
-    if not isinstance(self.file, codecs.StreamReaderWriter):
-      self.current = self.current.decode('utf-8')
+    self.current = self.readstring()
     if len(self.current) == 0:
       self.depleted = True
     self.current = self.current.rstrip('\n\r')
@@ -84,6 +89,13 @@ class LineReader(object):
     if self.linenumber % 1000 == 0:
       Trace.message('Parsing')
 
+  def readstring(self):
+    "Read the next raw line as a Unicode string."
+    string = self.file.readline()
+    if not isinstance(self.file, codecs.StreamReaderWriter):
+      string = string.decode('utf-8')
+    return string
+
   def finished(self):
     "Find out if the file is finished"
     if self.lastline and self.linenumber == self.lastline:
@@ -95,6 +107,100 @@ class LineReader(object):
   def close(self):
     self.file.close()
 
+class MappedLineReader(LineReader):
+  "Reads a memory-mapped file line by line."
+  "Keeps an index of line offsets, so it can jump to any line without reading."
+  "Falls back to a regular LineReader for streams and compressed files."
+  "Lines end on all Unicode line boundaries, just like codecs splits them."
+
+  # the line boundaries of unicode.splitlines(), encoded in UTF-8
+  boundary = re.compile('\r\n|[\n\r\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+
+  def __init__(self, filename):
+    self.map = None
+    if isinstance(filename, basestring):
+      self.map = self.mapfile(filename)
+    if not self.map:
+      LineReader.__init__(self, filename)
+      return
+    self.offset = 0
+    self.rawline = 0
+    self.offsets = array.array('L', [0])
+    self.linenumber = 1
+    self.lastline = None
+    self.current = None
+    self.mustread = True
+    self.depleted = False
+    try:
+      self.readline()
+    except UnicodeDecodeError:
+      self.close()
+      self.map = None
+      LineReader.__init__(self, filename)
+
+  def mapfile(self, filename):
+    "Map the given file into memory, if possible."
+    self.file = open(filename, 'rb')
+    if os.fstat(self.file.fileno()).st_size == 0:
+      self.file.close()
+      return None
+    if self.file.read(2) == '\x1f\x8b':
+      # gzip file
+      self.file.close()
+      return None
+    return mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+
+  def readstring(self):
+    "Read the next raw line from the map as a Unicode string."
+    if not self.map:
+      return LineReader.readstring(self)
+    if self.offset >= len(self.map):
+      return u''
+    match = self.boundary.search(self.map, self.offset)
+    if match:
+      end = match.end()
+    else:
+      end = len(self.map)
+    string = self.map[self.offset:end].decode('utf-8')
+    self.offset = end
+    self.rawline += 1
+    return string
+
+  def setstart(self, firstline):
+    "Set the first line to read, jumping over the skipped lines."
+    if not self.map:
+      LineReader.setstart(self, firstline)
+      return
+    self.skiplines(firstline)
+    self.linenumber = firstline
+
+  def skiplines(self, count):
+    "Skip a number of raw lines, using the line index."
+    target = self.rawline + count
+    self.indexto(target)
+    if target < len(self.offsets):
+      self.offset = self.offsets[target]
+      self.rawline = target
+    else:
+      self.offset = len(self.map)
+      self.rawline = len(self.offsets)
+
+  def indexto(self, line):
+    "Extend the line index up to the given line, if the file is long enough."
+    start = self.offsets[-1]
+    while len(self.offsets) <= line:
+      match = self.boundary.search(self.map, start)
+      if not match or match.end() >= len(self.map):
+        return
+      start = match.end()
+      self.offsets.append(start)
+
+  def close(self):
+    "Close the map and the file."
+    if self.map:
+      self.map.close()
+    self.file.close()
+
 class LineWriter(object):
   "Writes a file as a series of lists"
 
@@ -130,3 +236,163 @@ class LineWriter(object):
   def close(self):
     self.file.close()
 
+class BufferedLineWriter(LineWriter):
+  "Writes a file as a series of lists, keeping strings in a buffer."
+  "When the buffer reaches the given size (in characters), it is encoded"
+  "in one go and written with a single call."
+
+  size = 64 * 1024
+
+  def __init__(self, filename, size = None):
+    LineWriter.__init__(self, filename)
+    if size != None:
+      self.size = size
+    self.buffer = []
+    self.length = 0
+
+  def write(self, strings):
+    "Write a list of strings into the buffer."
+    for string in strings:
+      if not isinstance(string, basestring):
+        Trace.error('Not a string: ' + unicode(string) + ' in ' + unicode(strings))
+        break
+      self.buffer.append(string)
+      self.length += len(string)
+    if self.length >= self.size:
+      self.flush()
+
+  def writestring(self, string):
+    "Write a string into the buffer."
+    self.buffer.append(string)
+    self.length += len(string)
+    if self.length >= self.size:
+      self.flush()
+
+  def flush(self):
+    "Encode the buffer and write it to the file."
+    if not self.file:
+      self.file = open(self.filename, 'wb')
+    if len(self.buffer) > 0:
+      self.file.write(u''.join(self.buffer).encode('utf-8'))
+    self.buffer = []
+    self.length = 0
+
+  def close(self):
+    "Write anything left in the buffer and close the file."
+    self.flush()
+    self.file.close()
+
+
+class UpdateWriter(LineWriter):
+  "Writes a file only when its contents have changed, replacing it atomically."
+  "Contents are kept in memory until closing. The given variables (such as"
+  "the date) are left in the contents as <!--$name-->, and replaced with"
+  "their values when writing: any value in the old file counts as the same."
+
+  written = 0
+  skipped = 0
+  maxvalue = 100
+
+  def __init__(self, filename, variables):
+    LineWriter.__init__(self, filename)
+    self.variables = variables
+    self.buffer = []
+    self.changed = None
+
+  def write(self, strings):
+    "Write a list of strings into the buffer."
+    for string in strings:
+      if not isinstance(string, basestring):
+        Trace.error('Not a string: ' + unicode(string) + ' in ' + unicode(strings))
+        return
+      self.buffer.append(string)
+
+  def writestring(self, string):
+    "Write a string into the buffer."
+    self.buffer.append(string)
+
+  def close(self):
+    "Replace the file if the contents have changed, otherwise leave it alone."
+    contents = u''.join(self.buffer)
+    self.buffer = []
+    self.changed = not self.matches(contents)
+    if not self.changed:
+      UpdateWriter.skipped += 1
+      return
+    for name, value in self.variables.iteritems():
+      contents = contents.replace('<!--$' + name + '-->', value)
+    self.replace(contents.encode('utf-8'))
+    UpdateWriter.written += 1
+
+  def matches(self, contents):
+    "Find out if the old file has the same contents, except for the variables."
+    old = self.readold()
+    if old == None:
+      return False
+    names = [re.escape(name) for name in self.variables]
+    pieces = re.split('<!--\\$(?:' + '|'.join(names) + ')-->', contents)
+    if not old.startswith(pieces[0]):
+      return False
+    position = len(pieces[0])
+    for piece in pieces[1:]:
+      found = old.find(piece, position)
+      if found < 0 or not self.isvalue(old[position:found]):
+        return False
+      position = found + len(piece)
+    return position == len(old)
+
+  def readold(self):
+    "Read the old contents of the file, if possible."
+    if not os.path.exists(self.filename):
+      return None
+    try:
+      file = open(self.filename, 'rb')
+      try:
+        return file.read().decode('utf-8')
+      finally:
+        file.close()
+    except (IOError, UnicodeDecodeError):
+      return None
+
+  def isvalue(self, value):
+    "Find out if a bit of the old file can be the value of a variable."
+    if len(value) > self.maxvalue:
+      return False
+    for forbidden in '<>\n':
+      if forbidden in value:
+        return False
+    return True
+
+  def replace(self, contents):
+    "Write the contents to a temporary file, then move it in place."
+    directory = os.path.dirname(os.path.abspath(self.filename))
+    prefix = '.' + os.path.basename(self.filename) + '-'
+    descriptor, temporary = tempfile.mkstemp('.tmp', prefix, directory)
+    file = os.fdopen(descriptor, 'wb')
+    file.write(contents)
+    file.close()
+    os.chmod(temporary, self.getmode())
+    if os.name == 'nt' and os.path.exists(self.filename):
+      # rename does not replace files on Windows
+      os.remove(self.filename)
+    os.rename(temporary, self.filename)
+
+  def getmode(self):
+    "Get the permissions for the new file: those of the old one, if any."
+    if os.path.exists(self.filename):
+      return stat.S_IMODE(os.stat(self.filename).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0666 & ~umask
+
+  def report(cls):
+    "Report how many files were written and how many were unchanged."
+    if cls.written + cls.skipped == 0:
+      return
+    Trace.message('Written ' + unicode(cls.written) + ' files, '
+        + unicode(cls.skipped) + ' unchanged')
+
+  report = classmethod(report)
+
+ConversionContext.register(UpdateWriter, 'written', InitialValue(0).create)
+ConversionContext.register(UpdateWriter, 'skipped', InitialValue(0).create)
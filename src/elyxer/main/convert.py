@@ -26,6 +26,7 @@
 
 import os.path
 from elyxer.io.fileline import *
+from elyxer.io.bulk import *
 from elyxer.util.options import *
 from elyxer.gen.factory import *
 from elyxer.gen.toc import *
@@ -42,10 +43,12 @@ class eLyXerConverter(object):
 
   def __init__(self):
     self.filtering = False
+    self.context = ConversionContext.current
 
   def setio(self, ioparser):
     "Set the InOutParser"
-    self.reader = ioparser.getreader()
+    self.filein = ioparser.filein
+    self.reader = LyXLexer(ioparser.getreader())
     self.basket = self.getbasket()
     self.basket.setwriter(ioparser.getwriter())
     return self
@@ -58,7 +61,14 @@ class eLyXerConverter(object):
       return TOCBasket()
     if Options.splitpart:
       return SplitPartBasket()
+    if Options.twopass:
+      if isinstance(self.filein, basestring):
+        return StreamBasket()
+      Trace.error('Two passes need an input file; converting in memory')
+      return MemoryBasket()
     if Options.memory:
+      if Options.membudget != None:
+        return SpillBasket(Options.membudget)
       return MemoryBasket()
     return WriterBasket()
 
@@ -66,14 +76,21 @@ class eLyXerConverter(object):
     "Embed the results from elyxer.a reader into a memory basket."
     "Header and footer are ignored. Useful for embedding one document inside another."
     self.filtering = True
-    self.reader = reader
+    self.reader = LyXLexer(reader)
     self.basket = MemoryBasket()
     return self
 
   def convert(self):
     "Perform the conversion for the document"
+    if self.context:
+      self.context.activate()
     try:
+      if isinstance(self.basket, StreamBasket):
+        self.basket.setindex(self.indexdocument())
       self.processcontents()
+      ImageConverter.queue.waitall()
+      ImageManifest.saveall()
+      DimensionCache.savecache()
     except (Exception):
       version = '[eLyXer version ' + GeneralConfig.version['number']
       version += ' (' + GeneralConfig.version['date'] + ') in '
@@ -95,6 +112,22 @@ class eLyXerConverter(object):
     if not self.filtering:
       self.basket.finish()
 
+  def indexdocument(self):
+    "Read the input file in a first pass, and return the document index."
+    "The first pass is done in its own context, with the same options."
+    if not self.context:
+      self.context = ConversionContext.derive([Options, Trace]).activate()
+    ConversionContext.derive([Options, Trace]).activate()
+    Trace.quietmode = True
+    # images are converted in the second pass
+    Options.noconvert = True
+    indexer = eLyXerConverter()
+    indexer.reader = LyXLexer(LineReader(self.filein))
+    indexer.basket = IndexBasket()
+    indexer.processcontents()
+    self.context.activate()
+    return indexer.basket.index
+
   def writecontainer(self, container):
     "Write each container to the correct basket."
     if not container:
@@ -141,6 +174,9 @@ class InOutParser(object):
       self.readdir(self.fileout, 'destdirectory')
     else:
       Options.destdirectory = '.'
+    if Options.onlychanged and not isinstance(self.fileout, basestring):
+      # there is no file to compare with: write everything with its values
+      Options.onlychanged = False
     if len(args) > 0:
       raise Exception('Unused arguments: ' + unicode(args))
     return self
@@ -151,7 +187,9 @@ class InOutParser(object):
 
   def getwriter(self):
     "Get the resulting writer."
-    return LineWriter(self.fileout)
+    if Options.onlychanged:
+      return UpdateWriter(self.fileout, VariableMap().getvolatile())
+    return BufferedLineWriter(self.fileout, Options.buffersize)
 
   def readdir(self, filename, diroption):
     "Read the current directory if needed"
@@ -175,7 +213,7 @@ class ConverterFactory(object):
     "Create a converter for a given container, with filename"
     " and possibly other parameters."
     fullname = os.path.join(Options.directory, container.filename)
-    reader = LineReader(container.filename)
+    reader = MappedLineReader(container.filename)
     if 'firstline' in container.lstparams:
       reader.setstart(int(container.lstparams['firstline']))
     if 'lastline' in container.lstparams:
@@ -184,12 +222,141 @@ class ConverterFactory(object):
 
 IncludeInset.converterfactory = ConverterFactory()
 
+class DocumentBatch(object):
+  "Convert many documents with the same options, using a pool of processes."
+  "Each worker imports eLyXer only once and converts many documents."
+
+  def __init__(self, options):
+    self.options = options
+    self.context = ConversionContext.current
+    self.converted = 0
+    self.failed = 0
+
+  def convert(self, args):
+    "Convert all documents given as arguments or in the manifest."
+    pairs = self.readpairs(args)
+    pool = self.createpool(len(pairs))
+    if not pool:
+      self.report(self.convertall(pairs))
+    else:
+      jobargs = [(self.options, pair) for pair in pairs]
+      self.report(pool.imap_unordered(convertbatchpair, jobargs))
+      pool.close()
+      pool.join()
+    if self.failed > 0:
+      sys.exit(1)
+
+  def createpool(self, documents):
+    "Create a pool of processes for the given number of documents."
+    "Return None to convert sequentially: with a single job,"
+    "or if multiprocessing is not available (before Python 2.6)."
+    if Options.jobs == 1 or documents <= 1:
+      return None
+    try:
+      import multiprocessing
+    except ImportError:
+      Trace.debug('No multiprocessing module, converting documents sequentially')
+      return None
+    jobs = Options.jobs
+    if not jobs:
+      jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, documents)
+    if jobs <= 1:
+      return None
+    return multiprocessing.Pool(jobs)
+
+  def readpairs(self, args):
+    "Read the pairs of input and output filenames."
+    if len(args) % 2 != 0:
+      Trace.error('Batch conversion needs pairs of filein and fileout')
+      Options().usage()
+    pairs = []
+    for index in range(0, len(args), 2):
+      pairs.append((args[index], args[index + 1]))
+    if Options.manifest:
+      pairs += self.readmanifest(Options.manifest)
+    return pairs
+
+  def readmanifest(self, filename):
+    "Read a manifest file with a filein and a fileout on each line."
+    "They are separated by a tab, or by spaces if there is no tab;"
+    "if fileout is missing, filein is used with an .html extension."
+    "Blank lines and lines starting with # are ignored."
+    pairs = []
+    for line in BulkFile(filename).readall():
+      line = line.strip()
+      if line == '' or line.startswith('#'):
+        continue
+      if '\t' in line:
+        names = [name.strip() for name in line.split('\t')]
+      else:
+        names = line.split()
+      if len(names) == 1:
+        names.append(os.path.splitext(names[0])[0] + '.html')
+      if len(names) != 2:
+        Trace.error('Invalid line in manifest ' + filename + ': ' + line)
+        continue
+      pairs.append((names[0], names[1]))
+    return pairs
+
+  def convertall(self, pairs):
+    "Convert all pairs in this process, one at a time."
+    for pair in pairs:
+      yield self.convertpair(pair)
+
+  def convertpair(self, pair):
+    "Convert a document in a new context, isolating any errors."
+    "Return the filein and an error message, or None if successful."
+    filein, fileout = pair
+    try:
+      ConversionContext().activate()
+      Options().parseoptions(self.options + [filein, fileout])
+      convertfile([filein, fileout])
+    except (Exception, SystemExit):
+      error = unicode(sys.exc_info()[1])
+      if error == '':
+        error = sys.exc_info()[0].__name__
+      return filein, error
+    return filein, None
+
+  def report(self, results):
+    "Report the results of all conversions as they arrive."
+    for filein, error in results:
+      self.context.activate()
+      if error == None:
+        self.converted += 1
+      else:
+        self.failed += 1
+        Trace.error('Could not convert ' + filein + ': ' + error)
+    self.context.activate()
+    Trace.message('Converted ' + unicode(self.converted) + ' documents, '
+        + unicode(self.failed) + ' failed')
+
+def convertbatchpair(args):
+  "Convert a pair of files in a worker process."
+  options, pair = args
+  return DocumentBatch(options).convertpair(pair)
+
 def convertdoc(args):
   "Read a whole document from the command line and write it."
+  "Each document is converted in a new context."
+  "In batch mode, read many documents and convert them in parallel."
+  original = list(args)
+  ConversionContext().activate()
   Options().parseoptions(args)
+  if Options.jobs or Options.manifest:
+    options = original[:len(original) - len(args)]
+    DocumentBatch(options).convert(args)
+    return
+  convertfile(args)
+
+def convertfile(args):
+  "Convert a document from the command line, once options are parsed."
   ioparser = InOutParser().parse(args)
   converter = eLyXerConverter().setio(ioparser)
   converter.convert()
+  FormulaCache.cache.report()
+  UpdateWriter.report()
 
 def main():
   "Main function, called if invoked from the command line"
@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261017
+# eLyXer cache for rendered formulas
+
+import os
+import sys
+import marshal
+import tempfile
+from elyxer.util.trace import Trace
+from elyxer.util.options import *
+from elyxer.util.docparams import *
+from elyxer.conf.config import *
+from elyxer.gen.container import *
+from elyxer.util.context import *
+
+
+class FormulaCache(object):
+  "A cache for the HTML output of formulas."
+  "Formulas are keyed by their source, the output options, the eLyXer version"
+  "and the macros defined so far. Recently used results are kept in memory,"
+  "and also in the directory given by --formulacache to share them across runs."
+  "Formulas with side effects (labels, tags, counters, macro definitions...)"
+  "are never stored."
+
+  size = 5000
+  # types of formula bits with side effects, appended later
+  volatile = []
+
+  def __init__(self):
+    self.entries = dict()
+    self.used = dict()
+    self.tick = 0
+    self.environment = ''
+    self.hits = 0
+    self.diskhits = 0
+    self.misses = 0
+    self.uncached = 0
+
+  def get(self, source):
+    "Get the HTML for a formula source, or None if it is not cached."
+    key = self.getkey(source)
+    if not key in self.entries:
+      html = self.readdisk(key)
+      if html == None:
+        self.misses += 1
+        return None
+      self.diskhits += 1
+      self.remember(key, html)
+    self.hits += 1
+    self.tick += 1
+    self.used[key] = self.tick
+    return self.entries[key]
+
+  def store(self, source, whole):
+    "Store the HTML for a parsed and processed formula."
+    "Returns the HTML, or None if the formula cannot be cached."
+    if self.isvolatile(whole):
+      self.uncached += 1
+      return None
+    key = self.getkey(source)
+    html = whole.gethtml()
+    self.remember(key, html)
+    self.writedisk(key, html)
+    return html
+
+  def define(self, macro):
+    "Add a macro definition to the environment for subsequent formulas."
+    self.environment = self.digest([self.environment, macro.original])
+
+  def getkey(self, source):
+    "Get the key for a formula in the current environment."
+    return (source, DocumentParameters.displaymode, Options.html, Options.unicode,
+        Options.iso885915, Options.simplemath, GeneralConfig.version['number'],
+        GeneralConfig.version['date'], self.environment)
+
+  def isvolatile(self, whole):
+    "Find out if the formula contains any bits with side effects."
+    found = []
+    locate = lambda bit: isinstance(bit, tuple(self.volatile))
+    whole.locateprocess(locate, found.append)
+    return len(found) > 0
+
+  def remember(self, key, html):
+    "Keep the HTML in memory, forgetting the least recently used entries."
+    if len(self.entries) >= self.size:
+      self.forget(self.size / 4)
+    self.tick += 1
+    self.entries[key] = html
+    self.used[key] = self.tick
+
+  def forget(self, number):
+    "Forget the given number of least recently used entries."
+    ticks = [(tick, key) for key, tick in self.used.iteritems()]
+    ticks.sort()
+    for tick, key in ticks[:number]:
+      del self.entries[key]
+      del self.used[key]
+
+  def getfilename(self, key):
+    "Get the name of the file for a key in the cache directory."
+    if not Options.formulacache:
+      return None
+    return os.path.join(Options.formulacache, self.digest([repr(key)]))
+
+  def readdisk(self, key):
+    "Read the HTML for a key from the cache directory, if present."
+    filename = self.getfilename(key)
+    if not filename or not os.path.exists(filename):
+      return None
+    try:
+      file = open(filename, 'rb')
+      try:
+        stored = marshal.load(file)
+      finally:
+        file.close()
+    except (IOError, OSError, ValueError, EOFError):
+      Trace.debug('Unreadable formula cache file ' + filename)
+      return None
+    if not self.isvalid(stored) or stored[0] != key:
+      return None
+    return stored[1]
+
+  def isvalid(self, stored):
+    "Check that an entry read from disk is a key and a list of strings."
+    if not isinstance(stored, tuple) or len(stored) != 2:
+      return False
+    if not isinstance(stored[0], tuple) or not isinstance(stored[1], list):
+      return False
+    for piece in stored[1]:
+      if not isinstance(piece, basestring):
+        return False
+    return True
+
+  def writedisk(self, key, html):
+    "Write the HTML for a key to the cache directory."
+    "The file is written under a temporary name and then renamed,"
+    "so concurrent runs never see a partial entry."
+    filename = self.getfilename(key)
+    if not filename:
+      return
+    try:
+      if not os.path.exists(Options.formulacache):
+        os.makedirs(Options.formulacache)
+      handle, temporary = tempfile.mkstemp(dir = Options.formulacache)
+      file = os.fdopen(handle, 'wb')
+      try:
+        marshal.dump((key, list(html)), file)
+      finally:
+        file.close()
+      os.rename(temporary, filename)
+    except (IOError, OSError, ValueError, EOFError):
+      Trace.debug('Cannot write formula cache file ' + filename + ': ' + unicode(sys.exc_info()[1]))
+
+  def digest(self, pieces):
+    "Get a hex digest of a list of strings."
+    try:
+      from hashlib import sha1
+    except ImportError:
+      # Python 2.4
+      from sha import new as sha1
+    sha = sha1()
+    for piece in pieces:
+      sha.update(piece.encode('utf-8'))
+      sha.update('\0')
+    return sha.hexdigest()
+
+  def report(self):
+    "Show the hit and miss statistics."
+    Trace.debug('Formula cache: ' + unicode(self.hits) + ' hits (' +
+        unicode(self.diskhits) + ' from disk), ' + unicode(self.misses) +
+        ' misses, ' + unicode(self.uncached) + ' not cacheable')
+
+class CachedFormula(Container):
+  "The HTML output of a formula, as retrieved from the cache."
+
+  def __init__(self):
+    self.contents = []
+    self.html = []
+
+  def create(self, html):
+    "Create the contents with the given HTML."
+    self.html = html
+    return self
+
+  def gethtml(self):
+    "Return the cached HTML, which is already escaped."
+    return list(self.html)
+
+  def emithtml(self, html):
+    "Emit the cached HTML."
+    html.extend(self.html)
+
+FormulaCache.cache = FormulaCache()
+
+ConversionContext.register(FormulaCache.cache, 'environment', InitialValue('').create)
+
@@ -285,4 +285,5 @@ FormulaCommand.types = [
     AlphaCommand, EmptyCommand, OneParamFunction, FontFunction, LabelFunction,
     TextFunction, SpacedCommand,
     ]
+FormulaCache.volatile += [LabelFunction]
 
@@ -265,4 +265,5 @@ FormulaCommand.types += [
 FormulaProcessor.processors += [
     LimitsProcessor(), BracketProcessor(),
     ]
+FormulaCache.volatile += [TodayCommand]
 
@@ -30,6 +30,7 @@ from elyxer.util.docparams import *
 from elyxer.conf.config import *
 from elyxer.parse.formulaparse import *
 from elyxer.proc.formulaproc import *
+from elyxer.maths.cache import *
 
 
 class Formula(Container):
@@ -79,10 +80,18 @@ class Formula(Container):
 
   def classic(self):
     "Make the contents using classic output generation with XHTML and CSS."
-    whole = FormulaFactory().parseformula(self.parsed)
-    FormulaProcessor().process(whole)
-    whole.parent = self
-    self.contents = [whole]
+    html = FormulaCache.cache.get(self.parsed)
+    if html == None:
+      whole = FormulaFactory().parseformula(self.parsed)
+      FormulaProcessor().process(whole)
+      whole.parent = self
+      self.contents = [whole]
+      html = FormulaCache.cache.store(self.parsed, whole)
+      if html == None:
+        return
+    cached = CachedFormula().create(html)
+    cached.parent = self
+    self.contents = [cached]
 
   def parse(self, pos):
     "Parse using a parse position instead of self.parser."
@@ -158,6 +167,8 @@ class FormulaFactory(object):
   types = [FormulaSymbol, RawText, FormulaNumber, Bracket, Comment, WhiteSpace]
   skippedtypes = [Comment, WhiteSpace]
   defining = False
+  # first type detected for each char, filled on demand
+  dispatch = dict()
 
   def __init__(self):
     "Initialize the map of instances."
@@ -195,12 +206,32 @@ class FormulaFactory(object):
 
   def parseany(self, pos):
     "Parse any formula bit at the current location."
+    if not pos.finished():
+      type = self.dispatchtype(pos.current())
+      if type:
+        return self.parsetype(type, pos)
     for type in self.types + self.skippedtypes:
       if self.detecttype(type, pos):
         return self.parsetype(type, pos)
     Trace.error('Unrecognized formula at ' + pos.identifier())
     return FormulaConstant(pos.skipcurrent())
 
+  def dispatchtype(self, char):
+    "Get the first type that detects the given current char."
+    "Bit types are detected by their first char, so the type is probed only"
+    "once for each char and then kept in the dispatch table."
+    if not char in FormulaFactory.dispatch:
+      FormulaFactory.dispatch[char] = self.probetype(char)
+    return FormulaFactory.dispatch[char]
+
+  def probetype(self, char):
+    "Probe all types on a position that contains just the given char."
+    pos = TextPosition(char)
+    for type in self.types + self.skippedtypes:
+      if self.detecttype(type, pos):
+        return type
+    return None
+
   def parsetype(self, type, pos):
     "Parse the given type and return it."
     bit = self.instance(type)
@@ -28,24 +28,30 @@ from elyxer.parse.formulaparse import *
 from elyxer.parse.headerparse import *
 from elyxer.maths.formula import *
 from elyxer.maths.hybrid import *
+from elyxer.util.context import *
 
 
 class MacroDefinition(CommandBit):
   "A function that defines a new command (a macro)."
 
   macros = dict()
+  # incremented each time a macro is defined
+  generation = 0
 
   def parsebit(self, pos):
     "Parse the function that defines the macro."
     self.output = EmptyOutput()
     self.parameternumber = 0
     self.defaults = []
+    self.templates = dict()
     self.factory.defining = True
     self.parseparameters(pos)
     self.factory.defining = False
     Trace.debug('New command ' + self.newcommand + ' (' + \
         unicode(self.parameternumber) + ' parameters)')
     self.macros[self.newcommand] = self
+    MacroDefinition.generation += 1
+    FormulaCache.cache.define(self)
 
   def parseparameters(self, pos):
     "Parse all optional parameters (number of parameters, default values)"
@@ -74,8 +80,68 @@ class MacroDefinition(CommandBit):
     return 'unknown'
 
   def instantiate(self):
-    "Return an instance of the macro."
-    return self.definition.clone()
+    "Return an instance of the macro, and its parameters in order."
+    return self.gettemplate().instantiate()
+
+  def gettemplate(self):
+    "Get the template for the macro, parsing it if needed."
+    "Parsing depends on the display mode and on the macros defined so far,"
+    "so a template is kept for each display mode and macro generation."
+    mode = DocumentParameters.displaymode
+    if mode in self.templates:
+      template = self.templates[mode]
+      if template.generation == MacroDefinition.generation:
+        return template
+    template = MacroTemplate(self.definition)
+    self.templates[mode] = template
+    return template
+
+class MacroTemplate(object):
+  "A macro definition parsed once, with slots for its parameters."
+  "Each instance is a structural copy of the parsed definition."
+
+  def __init__(self, definition):
+    self.definition = definition
+    self.generation = MacroDefinition.generation
+    self.whole = definition.clone()
+    self.parameters = self.whole.searchall(MacroParameter)
+    # nested definitions must be parsed again to be defined again
+    self.reparse = len(self.whole.searchall(MacroDefinition)) > 0
+
+  def instantiate(self):
+    "Return a new instance of the definition, and its parameter slots."
+    if self.reparse:
+      whole = self.definition.clone()
+      return whole, whole.searchall(MacroParameter)
+    copier = BitCopier()
+    whole = copier.copy(self.whole)
+    return whole, [copier.copied[id(parameter)] for parameter in self.parameters]
+
+class BitCopier(object):
+  "Makes a structural copy of a parsed formula bit, without parsing."
+  "Bits, their outputs and lists are copied; anything else is shared."
+
+  def __init__(self):
+    self.copied = dict()
+
+  def copy(self, element):
+    "Copy an element that can be a bit, an output or a list."
+    if isinstance(element, list):
+      return [self.copy(item) for item in element]
+    if not isinstance(element, (FormulaBit, ContainerOutput)):
+      return element
+    if isinstance(element, MacroDefinition):
+      return element
+    if id(element) in self.copied:
+      return self.copied[id(element)]
+    result = object.__new__(element.__class__)
+    self.copied[id(element)] = result
+    for key, value in element.__dict__.iteritems():
+      if key == 'parent':
+        result.parent = self.copied.get(id(value), value)
+      else:
+        result.__dict__[key] = self.copy(value)
+    return result
 
 class MacroParameter(FormulaBit):
   "A parameter from elyxer.a macro."
@@ -162,15 +228,22 @@ class MacroFunction(CommandBit):
 
   def completemacro(self, macro):
     "Complete the macro with the parameters read."
-    self.contents = [macro.instantiate()]
+    "Each value is parsed again only once, and then copied for every use."
+    instance, parameters = macro.instantiate()
+    self.contents = [instance]
     replaced = [False] * len(self.values)
-    for parameter in self.searchall(MacroParameter):
+    clones = dict()
+    for parameter in parameters:
       index = parameter.number - 1
       if index >= len(self.values):
         Trace.error('Macro parameter index out of bounds: ' + unicode(index))
         return
       replaced[index] = True
-      parameter.contents = [self.values[index].clone()]
+      if not index in clones:
+        clones[index] = self.values[index].clone()
+        parameter.contents = [clones[index]]
+      else:
+        parameter.contents = [BitCopier().copy(clones[index])]
     for index in range(len(self.values)):
       if not replaced[index]:
         self.addfilter(index, self.values[index])
@@ -197,4 +270,9 @@ FormulaFactory.types += [ MacroParameter ]
 FormulaCommand.types += [
     MacroFunction,
     ]
+FormulaCache.volatile += [MacroDefinition]
+
+ConversionContext.register(MacroDefinition, 'macros', dict)
+# macro functions are looked up in the macros of the same context
+ConversionContext.register(MacroFunction, 'commandmap', lambda: MacroDefinition.macros)
 
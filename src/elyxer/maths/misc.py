@@ -64,4 +64,5 @@ class MiscCommand(CommandBit):
     return self.parsecommandtype(self.translated, commandtype, pos)
 
 FormulaCommand.types += [MiscCommand]
+FormulaCache.volatile += [SetCounterFunction, FormulaTag]
 
@@ -32,6 +32,14 @@ class ContainerOutput(object):
     "Show an error."
     Trace.error('gethtml() not implemented for ' + unicode(self))
 
+  def emithtml(self, container, html):
+    "Emit the HTML code into a list, or anything with append() and extend()."
+    result = self.gethtml(container)
+    if isinstance(result, basestring):
+      Trace.error('Raw string ' + result)
+      result = [result]
+    html.extend(result)
+
   def isempty(self):
     "Decide if the output is empty: by default, not empty."
     return False
@@ -59,14 +67,22 @@ class ContentsOutput(ContainerOutput):
   def gethtml(self, container):
     "Return the HTML code"
     html = []
+    self.emitcontents(container, html)
+    return html
+
+  def emithtml(self, container, html):
+    "Emit the HTML code for the contents."
+    self.emitcontents(container, html)
+
+  def emitcontents(self, container, html):
+    "Emit the HTML code for all contents, one after another."
     if container.contents == None:
-      return html
+      return
     for element in container.contents:
-      if not hasattr(element, 'gethtml'):
+      if not hasattr(element, 'emithtml'):
         Trace.error('No html in ' + element.__class__.__name__ + ': ' + unicode(element))
-        return html
-      html += element.gethtml()
-    return html
+        return
+      element.emithtml(html)
 
 class TaggedOutput(ContentsOutput):
   "Outputs an HTML tag surrounding the contents."
@@ -91,12 +107,18 @@ class TaggedOutput(ContentsOutput):
 
   def gethtml(self, container):
     "Return the HTML code."
+    html = []
+    self.emithtml(container, html)
+    return html
+
+  def emithtml(self, container, html):
+    "Emit the HTML code: open tag, contents and close tag."
     if self.empty:
-      return [self.selfclosing(container)]
-    html = [self.open(container)]
-    html += ContentsOutput.gethtml(self, container)
+      html.append(self.selfclosing(container))
+      return
+    html.append(self.open(container))
+    self.emitcontents(container, html)
     html.append(self.close(container))
-    return html
 
   def open(self, container):
     "Get opening line."
@@ -154,6 +176,10 @@ class FilteredOutput(ContentsOutput):
       result.append(self.filter(line))
     return result
 
+  def emithtml(self, container, html):
+    "Emit the filtered HTML code."
+    html.extend(self.gethtml(container))
+
   def filter(self, line):
     "Filter a single line with all available filters."
     for original, replacement in self.filters:
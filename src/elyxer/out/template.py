@@ -30,6 +30,7 @@ from elyxer.util.options import *
 from elyxer.util.translate import *
 from elyxer.util.docparams import *
 from elyxer.out.output import *
+from elyxer.util.context import *
 
 
 class HTMLTemplate(object):
@@ -236,6 +237,10 @@ class DefaultTemplate(HTMLTemplate):
 
 class VariableMap(object):
   "A map with all replacement variables."
+  "Volatile variables change on every run; when only writing changed files"
+  "they are left in place, and replaced by the writer."
+
+  volatile = ['year', 'date', 'datetime']
 
   def __init__(self):
     self.variables = dict()
@@ -273,12 +278,21 @@ class VariableMap(object):
     key = pos.globalpha()
     if not key in self.variables:
       Trace.error('Template variable ' + key + ' not found')
+    elif Options.onlychanged and key in self.volatile:
+      value = '<!--$' + key + '-->'
     else:
       value = self.variables[key]
     if not pos.checkskip('-->'):
       Trace.error('Weird template format in ' + line)
     return value
 
+  def getvolatile(self):
+    "Get the values of all volatile variables."
+    values = dict()
+    for key in self.volatile:
+      values[key] = self.variables[key]
+    return values
+
 class DocumentTitle(object):
   "The title of the whole document."
 
@@ -324,3 +338,12 @@ class FooterOutput(ContentsOutput):
     contents = ContentsOutput.gethtml(self, container)
     return contents + HTMLTemplate.get().convertfooter()
 
+  def emithtml(self, container, html):
+    "Emit the contents and then the footer."
+    self.emitcontents(container, html)
+    html.extend(HTMLTemplate.get().convertfooter())
+
+ConversionContext.register(HTMLTemplate, 'current', InitialValue(None).create)
+ConversionContext.register(DocumentTitle, 'title', InitialValue(None).create)
+ConversionContext.register(DocumentAuthor, 'author', InitialValue('').create)
+
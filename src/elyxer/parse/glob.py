@@ -114,7 +114,7 @@ class Globable(object):
 
   def globincluding(self, magicchar):
     "Glob a bit of text up to (including) the magic char."
-    glob = self.glob(lambda: self.current() != magicchar) + magicchar
+    glob = self.globexcluding(magicchar) + magicchar
     self.skip(magicchar)
     return glob
 
@@ -122,6 +122,10 @@ class Globable(object):
     "Glob a bit of text up until (excluding) any excluded character."
     return self.glob(lambda: self.current() not in excluded)
 
+  def globexcludingspace(self, excluded):
+    "Glob a bit of text up until any excluded character or whitespace."
+    return self.glob(lambda: self.current() not in excluded and not self.current().isspace())
+
   def pushending(self, ending, optional = False):
     "Push a new ending to the bottom"
     self.endinglist.add(ending, optional)
@@ -144,18 +148,24 @@ class Globable(object):
     return nextending.ending
 
 class EndingList(object):
-  "A list of position endings"
+  "A list of position endings."
+  "Keeps the initial chars of active endings to reject most positions at once."
 
   def __init__(self):
     self.endings = []
+    self.active = None
+    self.initials = None
+    self.anyinitial = False
 
   def add(self, ending, optional = False):
     "Add a new ending to the list"
     self.endings.append(PositionEnding(ending, optional))
+    self.active = None
 
   def pickpending(self, pos):
     "Pick any pending endings from a parse position."
     self.endings += pos.endinglist.endings
+    self.active = None
 
   def checkin(self, pos):
     "Search for an ending"
@@ -172,6 +182,7 @@ class EndingList(object):
     if not ending:
       Trace.error('No ending at ' + pos.current())
       return ''
+    self.active = None
     for each in reversed(self.endings):
       self.endings.remove(each)
       if each == ending:
@@ -185,13 +196,41 @@ class EndingList(object):
     "Find the ending at the current position"
     if len(self.endings) == 0:
       return None
-    for index, ending in enumerate(reversed(self.endings)):
+    if self.active == None:
+      self.getactive()
+    if not self.anyinitial and not pos.extract(1) in self.initials:
+      return None
+    for ending in self.active:
       if ending.checkin(pos):
         return ending
-      if not ending.optional:
-        return None
     return None
 
+  def findlimit(self, text, start, end):
+    "Find the first position in a text between start and end where"
+    "an ending is found; return end if there is none."
+    for ending in self.getactive():
+      found = text.find(ending.ending, start, end - 1 + len(ending.ending))
+      if found >= 0:
+        end = found
+    return end
+
+  def getactive(self):
+    "Get the endings that can be found: from the last one back to"
+    "the first non-optional. Also index their initial chars."
+    if self.active != None:
+      return self.active
+    self.active = []
+    self.initials = set()
+    self.anyinitial = False
+    for ending in reversed(self.endings):
+      self.active.append(ending)
+      if ending.ending == '':
+        self.anyinitial = True
+      self.initials.add(ending.ending[:1])
+      if not ending.optional:
+        break
+    return self.active
+
   def checkpending(self):
     "Check if there are any pending endings"
     if len(self.endings) != 0:
@@ -26,6 +26,7 @@ from elyxer.util.trace import Trace
 from elyxer.util.options import *
 from elyxer.conf.config import *
 from elyxer.parse.parser import *
+from elyxer.util.context import *
 
 
 class HeaderParser(Parser):
@@ -56,7 +57,7 @@ class HeaderParser(Parser):
 
   def parsebranch(self, reader):
     "Parse all branch definitions."
-    branch = reader.currentline().split()[1]
+    branch = reader.currenttoken().args[0]
     reader.nextline()
     subparser = HeaderParser().complete(HeaderConfig.parameters['endbranch'])
     subparser.parse(reader)
@@ -129,4 +130,6 @@ class LstParser(object):
         paramdict[key] = value
     return paramdict
 
+ConversionContext.register(LstParser, 'globalparams', dict)
+ConversionContext.register(PreambleParser, 'preamble', list)
 
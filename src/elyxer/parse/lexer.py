@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261017
+# eLyXer lexer: split LyX lines into tokens only once.
+
+from elyxer.util.trace import Trace
+from elyxer.conf.config import *
+
+
+class LyXToken(object):
+  "A single line of LyX code, classified and split into words."
+
+  empty = 'empty'
+  command = 'command'
+  xml = 'xml'
+  text = 'text'
+
+  def __init__(self, line, linenumber):
+    "Classify the line and split it into first word and remaining args."
+    self.line = line
+    self.linenumber = linenumber
+    self.rest = None
+    self.args = line.split()
+    self.first = ''
+    if len(self.args) > 0:
+      self.first = self.args.pop(0)
+    if line == '':
+      self.kind = LyXToken.empty
+    elif line.startswith(ContainerConfig.string['startcommand']):
+      self.kind = LyXToken.command
+    elif self.first.startswith('<'):
+      self.kind = LyXToken.xml
+    else:
+      self.kind = LyXToken.text
+
+  def getwords(self):
+    "Get all words in the line, including the first one."
+    if self.first == '':
+      return []
+    return [self.first] + self.args
+
+  def getrest(self):
+    "Get the text after the first word, without surrounding whitespace."
+    if self.rest == None:
+      split = self.line.split(None, 1)
+      self.rest = ''
+      if len(split) > 1:
+        self.rest = split[1].rstrip()
+    return self.rest
+
+  def __unicode__(self):
+    "Return a printable representation."
+    return 'Token ' + self.kind + '@' + unicode(self.linenumber) + ': ' + self.first
+
+class LyXLexer(object):
+  "Reads lines from a reader and converts each one into a token."
+  "Offers the same interface as a LineReader, plus currenttoken()."
+
+  def __init__(self, reader):
+    self.reader = reader
+    self.token = None
+
+  def currentline(self):
+    "Get the current line."
+    return self.reader.currentline()
+
+  def currenttoken(self):
+    "Get the token for the current line, lexing it only the first time."
+    if not self.token:
+      line = self.reader.currentline()
+      self.token = LyXToken(line, self.reader.linenumber)
+    return self.token
+
+  def nextline(self):
+    "Go to the next line."
+    self.token = None
+    self.reader.nextline()
+
+  def finished(self):
+    "Find out if the underlying reader is finished."
+    return self.reader.finished()
+
+  def setstart(self, firstline):
+    "Set the first line to read."
+    self.token = None
+    self.reader.setstart(firstline)
+
+  def setend(self, lastline):
+    "Set the last line to read."
+    self.reader.setend(lastline)
+
+  def getlinenumber(self):
+    "Get the line number of the underlying reader."
+    return self.reader.linenumber
+
+  def close(self):
+    "Close the underlying reader."
+    self.reader.close()
+
+  linenumber = property(getlinenumber)
+
@@ -25,6 +25,8 @@
 from elyxer.util.trace import Trace
 from elyxer.util.options import *
 from elyxer.conf.config import *
+from elyxer.parse.lexer import *
+from elyxer.util.context import *
 
 
 class Parser(object):
@@ -36,29 +38,28 @@ class Parser(object):
 
   def parseheader(self, reader):
     "Parse the header"
-    header = reader.currentline().split()
+    header = reader.currenttoken().getwords()
     reader.nextline()
     self.begin = reader.linenumber
     return header
 
   def parseparameter(self, reader):
     "Parse a parameter"
-    if reader.currentline().strip().startswith('<'):
+    token = reader.currenttoken()
+    if token.kind == LyXToken.xml:
       key, value = self.parsexml(reader)
       self.parameters[key] = value
       return
-    split = reader.currentline().strip().split(' ', 1)
     reader.nextline()
-    if len(split) == 0:
-      return
-    key = split[0]
-    if len(split) == 1:
+    key = token.first
+    rest = token.getrest()
+    if rest == '':
       self.parameters[key] = True
       return
-    if not '"' in split[1]:
-      self.parameters[key] = split[1].strip()
+    if not '"' in rest:
+      self.parameters[key] = rest
       return
-    doublesplit = split[1].split('"')
+    doublesplit = rest.split('"')
     self.parameters[key] = doublesplit[1]
 
   def parsexml(self, reader):
@@ -135,12 +136,12 @@ class TextParser(Parser):
 
   def isending(self, reader):
     "Check if text is ending"
-    current = reader.currentline().split()
-    if len(current) == 0:
+    first = reader.currenttoken().first
+    if first == '':
       return False
-    if current[0] in self.endings:
-      if current[0] in TextParser.stack:
-        TextParser.stack.remove(current[0])
+    if first in self.endings:
+      if first in TextParser.stack:
+        TextParser.stack.remove(first)
       else:
         TextParser.stack = []
       return True
@@ -199,3 +200,5 @@ class InsetParser(BoundedParser):
       self.parseparameter(reader)
     return BoundedParser.parse(self, reader)
 
+ConversionContext.register(TextParser, 'stack', list)
+
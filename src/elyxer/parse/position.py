@@ -22,6 +22,7 @@
 # Alex 20090503
 # eLyXer formula parsing
 
+import re
 from elyxer.io.fileline import *
 from elyxer.util.trace import Trace
 from elyxer.conf.config import *
@@ -86,6 +87,14 @@ class Position(Globable):
 
 class TextPosition(Position):
   "A parse position based on a raw text."
+  "Common globs are matched directly on the text with regular expressions."
+
+  alphapattern = re.compile(r'[^\W\d_]+', re.UNICODE)
+  wordpattern = re.compile(r'\w+', re.UNICODE)
+  spacepattern = re.compile(r'\s+', re.UNICODE)
+  valuepattern = re.compile(r'[^\s{}()]+', re.UNICODE)
+  excludingpatterns = dict()
+  excludingspacepatterns = dict()
 
   def __init__(self, text):
     "Create the position from elyxer.some text."
@@ -119,13 +128,74 @@ class TextPosition(Position):
       return None
     return self.text[self.pos : self.pos + length]
 
+  def globalpha(self):
+    "Glob a bit of alpha text."
+    return self.globmatch(TextPosition.alphapattern, lambda text: text.isalpha())
+
+  def globnumber(self):
+    "Glob a row of digits."
+    return self.globmatch(TextPosition.wordpattern, lambda text: text.isdigit())
+
+  def globidentifier(self):
+    "Glob alphanumeric and _ symbols."
+    return self.globmatch(TextPosition.wordpattern)
+
+  def globvalue(self):
+    "Glob a value: any symbols but brackets."
+    return self.globmatch(TextPosition.valuepattern)
+
+  def skipspace(self):
+    "Skip all whitespace at current position."
+    return self.globmatch(TextPosition.spacepattern)
+
+  def globexcluding(self, excluded):
+    "Glob a bit of text up until (excluding) any excluded character."
+    characters = excluded
+    if not isinstance(excluded, basestring):
+      # only single chars in a list can be equal to the current char
+      characters = ''.join([piece for piece in excluded if len(piece) == 1])
+    if not characters in TextPosition.excludingpatterns:
+      pattern = re.compile('.+', re.DOTALL)
+      if characters != '':
+        pattern = re.compile('[^' + re.escape(characters) + ']+', re.UNICODE)
+      TextPosition.excludingpatterns[characters] = pattern
+    return self.globmatch(TextPosition.excludingpatterns[characters])
+
+  def globexcludingspace(self, excluded):
+    "Glob a bit of text up until any excluded character or whitespace."
+    characters = ''.join(excluded)
+    if not characters in TextPosition.excludingspacepatterns:
+      pattern = re.compile('[^' + re.escape(characters) + '\\s]+', re.UNICODE)
+      TextPosition.excludingspacepatterns[characters] = pattern
+    return self.globmatch(TextPosition.excludingspacepatterns[characters])
+
+  def globmatch(self, pattern, check = None):
+    "Glob the text matched by a pattern, stopping at the first ending."
+    "The pattern may match more than needed: then a check on each char trims it."
+    match = pattern.match(self.text, self.pos)
+    if not match:
+      end = self.pos
+    else:
+      end = match.end()
+      if check and not check(self.text[self.pos:end]):
+        end = self.pos
+        while check(self.text[end]):
+          end += 1
+    end = self.endinglist.findlimit(self.text, self.pos, end)
+    glob = self.text[self.pos:end]
+    self.pos = end
+    if self.isout():
+      # check for pending endings
+      self.finished()
+    return glob
+
 class FilePosition(Position):
   "A parse position based on an underlying file."
 
   def __init__(self, filename):
     "Create the position from a file."
     Position.__init__(self)
-    self.reader = LineReader(filename)
+    self.reader = MappedLineReader(filename)
     self.pos = 0
     self.checkbytemark()
 
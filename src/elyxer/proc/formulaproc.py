@@ -45,9 +45,12 @@ class FormulaProcessor(object):
 
   def process(self, bit):
     "Process the contents of every formula bit, recursively."
+    "Bits are processed first; then a single pass runs the maths processors"
+    "and collects the bits with a type, which are then altered in order."
+    self.typed = []
     self.processcontents(bit)
-    self.processinsides(bit)
-    self.traversewhole(bit)
+    self.processinsides(bit, True)
+    self.traversewhole()
 
   def processcontents(self, bit):
     "Process the contents of a formula bit."
@@ -57,35 +60,48 @@ class FormulaProcessor(object):
     for element in bit.contents:
       self.processcontents(element)
 
-  def processinsides(self, bit):
+  def processinsides(self, bit, collecting):
     "Process the insides (limits, brackets) in a formula bit."
+    "If collecting, bits with a type are collected in order along the way."
     if not isinstance(bit, FormulaBit):
       return
-    for index, element in enumerate(bit.contents):
+    contents = bit.contents
+    for index, element in enumerate(contents):
       for processor in self.processors:
-        processor.process(bit.contents, index)
+        processor.process(contents, index)
       # continue with recursive processing
-      self.processinsides(element)
-
-  def traversewhole(self, formula):
-    "Traverse over the contents to alter variables and space units."
+      if not self.place(contents[index], contents, element, collecting):
+        self.processinsides(element, False)
+
+  def place(self, bit, contents, element, collecting):
+    "Collect a bit at its final place in the contents, and process the element."
+    "The bit is the element unless a processor has wrapped it in a new bit;"
+    "other bits in the wrapper are collected but their insides are not processed."
+    "Return if the element has been processed."
+    if collecting and hasattr(bit, 'type') and bit.type:
+      self.typed.append((bit, contents))
+      collecting = False
+    if bit is element:
+      self.processinsides(bit, collecting)
+      return True
+    if not isinstance(bit, FormulaBit):
+      return False
+    processed = False
+    for part in bit.contents:
+      if self.place(part, bit.contents, element, collecting):
+        processed = True
+    return processed
+
+  def traversewhole(self):
+    "Traverse over the collected bits to alter variables and space units."
     last = None
-    for bit, contents in self.traverse(formula):
+    for bit, contents in self.typed:
       if bit.type == 'alpha':
         self.italicize(bit, contents)
       elif bit.type == 'font' and last and last.type == 'number':
         bit.contents.insert(0, FormulaConstant(u' '))
       last = bit
 
-  def traverse(self, bit):
-    "Traverse a formula and yield a flattened structure of (bit, list) pairs."
-    for element in bit.contents:
-      if hasattr(element, 'type') and element.type:
-        yield (element, bit.contents)
-      elif isinstance(element, FormulaBit):
-        for pair in self.traverse(element):
-          yield pair
-
   def italicize(self, bit, contents):
     "Italicize the given bit of text."
     index = contents.index(bit)
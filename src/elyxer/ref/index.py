@@ -31,6 +31,7 @@ from elyxer.gen.styles import *
 from elyxer.ref.link import *
 from elyxer.ref.partkey import *
 from elyxer.proc.process import *
+from elyxer.util.context import *
 
 
 class ListInset(Container):
@@ -265,3 +266,6 @@ class PreListInset(object):
 
 Processor.prestages += [PreListInset()]
 
+ConversionContext.register(IndexGroup, 'root', lambda: IndexGroup().create())
+ConversionContext.register(NomenclatureEntry, 'entries', dict)
+
@@ -29,6 +29,7 @@ from elyxer.gen.container import *
 from elyxer.gen.styles import *
 from elyxer.ref.link import *
 from elyxer.proc.postprocess import *
+from elyxer.util.context import *
 
 
 class Label(Link):
@@ -140,3 +141,7 @@ class Reference(Link):
     "Return a printable representation."
     return 'Reference ' + self.key
 
+ConversionContext.register(Label, 'names', dict)
+ConversionContext.register(Label, 'lastlayout', InitialValue(None).create)
+ConversionContext.register(Reference, 'references', dict)
+
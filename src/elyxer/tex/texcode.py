@@ -126,7 +126,10 @@ class TeXCode(Container):
 
   def parsetext(self, pos):
     "Parse a bit of text, excluding separators and compressing spaces."
-    text = self.parsecompressingspace(pos)
+    self.addplain(self.parsecompressingspace(pos))
+
+  def addplain(self, text):
+    "Add some plain text, replacing any strings in the config."
     if text == '':
       return
     for key in self.replaced:
@@ -138,7 +141,7 @@ class TeXCode(Container):
     "Parse some text excluding value separators and compressing spaces."
     parsed = ''
     while not pos.finished():
-      parsed += pos.glob(lambda: self.excludespaces(pos))
+      parsed += pos.globexcludingspace(self.texseparators)
       if not pos.finished() and pos.current().isspace():
         parsed += ' '
         pos.skipspace()
@@ -146,15 +149,6 @@ class TeXCode(Container):
         return parsed
     return parsed
 
-  def excludespaces(self, pos):
-    "Exclude value separators and spaces."
-    current = pos.current()
-    if current in self.texseparators:
-      return False
-    if current.isspace():
-      return False
-    return True
-
   def parseescaped(self, pos):
     "Parse an escaped string \\*."
     if pos.checkfor('\\(') or pos.checkfor('\\['):
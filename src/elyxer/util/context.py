@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261017
+# eLyXer conversion context: the state for a single document
+
+import copy
+from elyxer.util.trace import Trace
+
+
+class ConversionContext(object):
+  "The state of the conversion of a single document."
+  "Classes keep document state in class attributes, which are registered here"
+  "along with a function that creates their initial value. Each context owns"
+  "its own values, and places them in the classes while it is active."
+
+  registered = []
+  current = None
+
+  def __init__(self):
+    self.values = dict()
+
+  def activate(self):
+    "Make this the current context, saving the state of the previous one."
+    if ConversionContext.current == self:
+      return self
+    if ConversionContext.current:
+      ConversionContext.current.save()
+    for holder, name, create in self.registered:
+      key = (holder, name)
+      if not key in self.values:
+        # values are created in order, so they may refer to previous ones
+        self.values[key] = create()
+      setattr(holder, name, self.values[key])
+    ConversionContext.current = self
+    return self
+
+  def save(self):
+    "Save the values of all registered attributes in this context."
+    for holder, name, create in self.registered:
+      self.values[(holder, name)] = getattr(holder, name)
+
+  def derive(cls, holders):
+    "Create a new context which starts with copies of the current values"
+    "of the given classes, and creates anew all other values."
+    context = ConversionContext()
+    for holder, name, create in cls.registered:
+      if holder in holders:
+        context.values[(holder, name)] = copy.copy(getattr(holder, name))
+    return context
+
+  def register(cls, holder, name, create):
+    "Register an attribute of a class (or object) that holds document state."
+    cls.registered.append((holder, name, create))
+
+  def registerall(cls, holder):
+    "Register all plain attributes of a class, such as options."
+    "Their initial value is a copy of the value they have now."
+    names = holder.__dict__.keys()
+    names.sort()
+    for name in names:
+      value = holder.__dict__[name]
+      if name.startswith('_') or callable(value) or isinstance(value, classmethod):
+        continue
+      cls.register(holder, name, InitialValue(value).create)
+
+  derive = classmethod(derive)
+  register = classmethod(register)
+  registerall = classmethod(registerall)
+
+class InitialValue(object):
+  "The initial value for an attribute, copied for each new context."
+
+  def __init__(self, value):
+    self.value = value
+
+  def create(self):
+    "Create a copy of the initial value."
+    return copy.copy(self.value)
+
+ConversionContext.registerall(Trace)
+
@@ -23,6 +23,7 @@
 # eLyXer: LyX document parameters
 
 from elyxer.util.trace import Trace
+from elyxer.util.context import *
 
 
 class DocumentParameters(object):
@@ -38,3 +39,5 @@ class DocumentParameters(object):
   outputchanges = False
   displaymode = False
 
+ConversionContext.registerall(DocumentParameters)
+
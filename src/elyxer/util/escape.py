@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261017
+# eLyXer escaping of strings with replacement maps
+
+import re
+from elyxer.util.trace import Trace
+from elyxer.util.options import *
+from elyxer.conf.config import *
+
+
+class Escaper(object):
+  "Escapes strings with a sequence of replacement maps."
+  "Within each map replacements are done in sorted order, one piece after another."
+  "Consecutive pieces that cannot interfere are compiled into a single pass."
+
+  compiled = dict()
+  single = dict()
+  output = dict()
+
+  def __init__(self, maps):
+    "Compile the given maps into stages."
+    self.pieces = []
+    self.stages = []
+    for replacements in maps:
+      pieces = replacements.keys()
+      pieces.sort()
+      for piece in pieces:
+        if len(self.stages) == 0 or not self.stages[-1].accepts(piece):
+          self.stages.append(EscapeStage())
+        self.stages[-1].add(piece, replacements[piece])
+        self.pieces.append(piece)
+    for stage in self.stages:
+      stage.compile()
+    if len(self.stages) == 1:
+      self.escape = self.stages[0].escape
+
+  def escape(self, line):
+    "Escape a line with all stages in order."
+    "If no piece is found there is nothing to do: no stage can create one."
+    for piece in self.pieces:
+      if piece in line:
+        return self.escapestages(line)
+    return line
+
+  def escapestages(self, line):
+    "Run all stages on a line, one after another."
+    for stage in self.stages:
+      line = stage.escape(line)
+    return line
+
+  def get(cls, maps):
+    "Get the compiled escaper for a list of maps."
+    key = tuple([id(replacements) for replacements in maps])
+    if not key in cls.compiled:
+      # keep the maps so that their ids are not reused
+      cls.compiled[key] = (list(maps), Escaper(maps))
+    return cls.compiled[key][1]
+
+  def getmap(cls, replacements):
+    "Get the compiled escaper for a single map."
+    if not id(replacements) in cls.single:
+      cls.single[id(replacements)] = cls.get([replacements])
+    return cls.single[id(replacements)]
+
+  def getoutput(cls):
+    "Get the compiled escaper for output lines, according to the options."
+    key = (Options.html, Options.iso885915, Options.unicode)
+    if not key in cls.output:
+      maps = []
+      if Options.html:
+        maps.append(EscapeConfig.html)
+      if Options.iso885915:
+        maps.append(EscapeConfig.iso885915)
+      elif not Options.unicode:
+        maps.append(EscapeConfig.nonunicode)
+      cls.output[key] = cls.get(maps)
+    return cls.output[key]
+
+  get = classmethod(get)
+  getmap = classmethod(getmap)
+  getoutput = classmethod(getoutput)
+
+class EscapeStage(object):
+  "A number of replacements that can be done in a single pass."
+  "A piece joins the stage only if doing it at the same time as the previous"
+  "pieces gives the same result as doing it after them: it must not overlap"
+  "any of them, and their replacements must not create it."
+
+  def __init__(self):
+    self.pieces = []
+    self.replacements = dict()
+    self.pattern = None
+
+  def accepts(self, piece):
+    "Find out if a piece can be replaced in the same pass as the previous ones."
+    for previous in self.pieces:
+      if self.overlap(previous, piece) or self.overlap(piece, previous):
+        return False
+      replacement = self.replacements[previous]
+      if replacement == '' and len(piece) > 1:
+        # removing the previous piece can join text around it
+        return False
+      for char in replacement:
+        if char in piece:
+          return False
+    return True
+
+  def overlap(self, first, second):
+    "Find out if the second piece can overlap the end of the first."
+    if first in second:
+      return True
+    for length in range(1, len(first)):
+      if second.startswith(first[-length:]):
+        return True
+    return False
+
+  def add(self, piece, replacement):
+    "Add a piece and its replacement."
+    self.pieces.append(piece)
+    self.replacements[piece] = replacement
+
+  def compile(self):
+    "Compile the pattern for several pieces."
+    if len(self.pieces) == 1:
+      return
+    alternatives = [re.escape(piece) for piece in self.pieces]
+    self.pattern = re.compile('|'.join(alternatives), re.UNICODE)
+
+  def escape(self, line):
+    "Do all replacements in the stage."
+    for piece in self.pieces:
+      if piece in line:
+        if not self.pattern:
+          return line.replace(piece, self.replacements[piece])
+        return self.pattern.sub(self.replace, line)
+    return line
+
+  def replace(self, match):
+    "Get the replacement for a matched piece."
+    return self.replacements[match.group(0)]
+
+class EntityEscaper(object):
+  "Escapes all non-ASCII characters to numeric HTML entities, in a single pass."
+  "A character 0xd835 and the next one are a surrogate pair for a math letter."
+
+  pattern = re.compile(u'\ud835[\\s\\S]?|[^\x00-\x80]', re.UNICODE)
+
+  def __init__(self):
+    self.entities = dict()
+
+  def escape(self, line):
+    "Escape all characters beyond ASCII in a line."
+    return self.pattern.sub(self.getentity, line)
+
+  def getentity(self, match):
+    "Get the entity for a matched character, or surrogate pair."
+    text = match.group(0)
+    if not text in self.entities:
+      codepoint = ord(text[-1])
+      if len(text) == 2:
+        codepoint += 0xf800
+      self.entities[text] = '&#x%x;' % codepoint
+    return self.entities[text]
+
+EntityEscaper.instance = EntityEscaper()
+
@@ -26,6 +26,7 @@ from elyxer.util.trace import Trace
 from elyxer.util.translate import *
 from elyxer.util.docparams import *
 from elyxer.conf.config import *
+from elyxer.util.context import *
 
 
 class NumberCounter(object):
@@ -264,3 +265,6 @@ class ChapteredGenerator(NumberGenerator):
 NumberGenerator.chaptered = ChapteredGenerator()
 NumberGenerator.generator = NumberGenerator()
 
+ConversionContext.register(NumberGenerator, 'counters', dict)
+ConversionContext.register(NumberGenerator, 'appendix', InitialValue(None).create)
+
@@ -27,6 +27,7 @@ import sys
 from elyxer.conf.config import *
 from elyxer.util.trace import *
 from elyxer.util.clparse import *
+from elyxer.util.context import *
 
 
 class Options(object):
@@ -59,8 +60,11 @@ class Options(object):
   lyxformat = False
   target = None
   splitpart = None
+  splitjobs = None
   memory = True
   lowmem = False
+  twopass = False
+  membudget = None
   nobib = False
   converter = 'imagemagick'
   raw = False
@@ -82,8 +86,18 @@ class Options(object):
   footnotes = None
   imageformat = None
   copyimages = False
+  imagejobs = None
+  batchconverter = None
+  imagemanifest = False
+  dimensioncache = None
   googlecharts = False
   embedcss = []
+  formulacache = None
+  batch = None
+  buffersize = None
+  onlychanged = False
+  jobs = None
+  manifest = None
 
   branches = dict()
 
@@ -119,7 +133,12 @@ class Options(object):
       except:
         Trace.error('--splitpart needs a numeric argument, not ' + Options.splitpart)
         self.usage()
-    if Options.lowmem or Options.toc or Options.tocfor:
+    self.readint('buffersize', 0)
+    self.readint('membudget', 0)
+    self.readint('imagejobs', 1)
+    self.readint('splitjobs', 1)
+    self.readint('jobs', 1)
+    if Options.lowmem or Options.twopass or Options.toc or Options.tocfor:
       Options.memory = False
     self.parsefootnotes()
     if Options.forceformat and not Options.imageformat:
@@ -152,6 +171,21 @@ class Options(object):
     Trace.error('Main program of the eLyXer package (http://elyxer.nongnu.org/).')
     self.showoptions()
 
+  def readint(self, name, minimum):
+    "Read a numeric option, if present, as an integer not below the minimum."
+    value = getattr(Options, name)
+    if not value:
+      return
+    try:
+      value = int(value)
+    except ValueError:
+      Trace.error('--' + name + ' needs a numeric argument, not ' + unicode(value))
+      self.usage()
+    if value < minimum:
+      Trace.error('--' + name + ' requires a number not smaller than ' + unicode(minimum))
+      self.usage()
+    setattr(Options, name, value)
+
   def parsefootnotes(self):
     "Parse footnotes options."
     if not Options.footnotes:
@@ -197,6 +231,10 @@ class Options(object):
     Trace.error('    --imageformat ".ext":   image output format, or "copy" to copy images')
     Trace.error('    --noconvert:            do not convert images, use in original locations')
     Trace.error('    --converter "inkscape": use an alternative program to convert images')
+    Trace.error('    --imagejobs "n":        convert up to n images at the same time')
+    Trace.error('    --batchconverter "imagemagick": convert many images with each command')
+    Trace.error('    --imagemanifest:        skip converting images with the same contents and settings')
+    Trace.error('    --dimensioncache "file": keep image dimensions in a file across runs')
     Trace.error('  Options for footnote display:')
     Trace.error('    --numberfoot:           mark footnotes with numbers instead of letters')
     Trace.error('    --symbolfoot:           mark footnotes with symbols (*, **...)')
@@ -210,16 +248,25 @@ class Options(object):
     Trace.error('        "sup", "align"')
     Trace.error('  Advanced output options:')
     Trace.error('    --splitpart "depth":    split the resulting webpage at the given depth')
+    Trace.error('    --splitjobs "n":        write split pages using n processes')
     Trace.error('    --tocfor "page":        generate a TOC that points to the given page')
     Trace.error('    --target "frame":       make all links point to the given frame')
     Trace.error('    --notoclabels:          omit the part labels in the TOC, such as Chapter')
     Trace.error('    --lowmem:               do the conversion on the fly (conserve memory)')
+    Trace.error('    --twopass:              index first, then convert on the fly (conserve memory)')
+    Trace.error('    --membudget "MB":       above this memory, keep only what needs processing')
     Trace.error('    --raw:                  generate HTML without header or footer.')
     Trace.error('    --mathjax remote:       use MathJax remotely to display equations')
     Trace.error('    --mathjax "URL":        use MathJax from the given URL to display equations')
     Trace.error('    --googlecharts:         use Google Charts to generate formula images')
     Trace.error('    --template "file":      use a template, put everything in <!--$content-->')
     Trace.error('    --copyright:            add a copyright notice at the bottom')
+    Trace.error('    --formulacache "dir":   keep rendered formulas in a directory across runs')
+    Trace.error('    --buffersize "chars":   write output in chunks of this size (0 for unbuffered)')
+    Trace.error('    --onlychanged:          only replace output files whose contents change')
+    Trace.error('  Options for batch conversion:')
+    Trace.error('    --jobs "n":             convert pairs of filein fileout using n processes')
+    Trace.error('    --manifest "file":      also convert all filein fileout pairs listed in a file')
     Trace.error('  Deprecated options:')
     Trace.error('    --toc:                  (deprecated) create a table of contents')
     Trace.error('    --toctarget "page":     (deprecated) generate a TOC for the given page')
@@ -274,3 +321,5 @@ class BranchOptions(object):
     "String representation"
     return 'options for ' + self.name + ': ' + unicode(self.options)
 
+ConversionContext.registerall(Options)
+
@@ -29,6 +29,7 @@ from elyxer.gen.layout import *
 from elyxer.gen.inset import *
 from elyxer.gen.float import *
 from elyxer.ref.label import *
+from elyxer.util.context import *
 
 
 class NewfangledChunk(Layout):
@@ -216,3 +217,9 @@ class NewfangledChunkRef(Inset):
     "Return a printable representation."
     return 'Reference to chunk ' + self.ref
 
+ConversionContext.register(NewfangledChunk, 'names', dict)
+ConversionContext.register(NewfangledChunk, 'firsttime', InitialValue(True).create)
+ConversionContext.register(ChunkProcessor, 'counters', dict)
+ConversionContext.register(ChunkProcessor, 'lastchunk', InitialValue(None).create)
+ConversionContext.register(NewfangledChunkRef, 'references', dict)
+
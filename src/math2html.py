@@ -22,6 +22,7 @@
 # Alex 20101110
 # eLyXer standalone formula conversion to HTML.
 
+import os
 from elyxer.util.trace import Trace
 from elyxer.util.options import *
 from elyxer.maths.formula import *
@@ -33,23 +34,145 @@ from elyxer.maths.macro import *
 from elyxer.proc.formulaproc import *
 
 
-def math2html(formula):
+def math2html(formula, factory = None):
   "Convert some TeX math to HTML."
-  factory = FormulaFactory()
-  whole = factory.parseformula(formula)
-  FormulaProcessor().process(whole)
-  whole.process()
-  return ''.join(whole.gethtml())
+  "An existing formula factory can be reused across calls."
+  html = FormulaCache.cache.get(formula)
+  if html == None:
+    if not factory:
+      factory = FormulaFactory()
+    whole = factory.parseformula(formula)
+    FormulaProcessor().process(whole)
+    whole.process()
+    html = FormulaCache.cache.store(formula, whole)
+    if html == None:
+      html = whole.gethtml()
+  return ''.join(html)
+
+class BatchConverter(object):
+  "Convert a stream of formulas to HTML, one record at a time."
+  "Records are separated by newlines, by NUL characters or are JSON lines."
+  "Each result is written with the same separator and flushed right away,"
+  "so that the converter can be used as a long-lived coprocess."
+
+  delimiters = {'lines':'\n', 'nul':'\0', 'json':'\n'}
+  chunk = 4096
+
+  def __init__(self, mode):
+    self.mode = mode
+    self.delimiter = self.delimiters[mode]
+    self.factory = FormulaFactory()
+    self.records = 0
+    self.errors = 0
+    if mode == 'json':
+      self.json = self.importjson()
+
+  def importjson(self):
+    "Import the json module, only needed in JSON mode."
+    try:
+      import json
+    except ImportError:
+      Trace.error('JSON records need the json module, from Python 2.6')
+      sys.exit(1)
+    return json
+
+  def convert(self, input, output):
+    "Convert all records from the input and write them to the output."
+    for record in self.readrecords(input):
+      output.write(self.convertrecord(record) + self.delimiter)
+      output.flush()
+    Trace.debug('Converted ' + unicode(self.records) + ' formulas with ' +
+        unicode(self.errors) + ' errors')
+
+  def readrecords(self, input):
+    "Read records from the input as soon as they are complete."
+    "Reading is done on the file descriptor to avoid waiting on a full buffer."
+    pending = ''
+    while True:
+      data = os.read(input.fileno(), self.chunk)
+      if not data:
+        break
+      pending += data
+      records = pending.split(self.delimiter)
+      pending = records.pop()
+      for record in records:
+        yield record
+    if pending != '':
+      yield pending
+
+  def convertrecord(self, record):
+    "Convert a single record, isolating any errors."
+    self.records += 1
+    identifier = None
+    try:
+      record = record.decode('utf-8')
+      if self.mode == 'json':
+        formula, identifier = self.parsejson(record)
+      else:
+        formula = record.rstrip('\r')
+      html = math2html(formula, self.factory)
+    except Exception:
+      self.errors += 1
+      error = unicode(sys.exc_info()[1])
+      Trace.error('Error in formula record ' + unicode(self.records) + ': ' + error)
+      return self.serialize(None, error, identifier)
+    return self.serialize(html, None, identifier)
+
+  def parsejson(self, record):
+    "Parse a JSON record: either a string or an object with a formula."
+    "Return the formula and the identifier of the record, if any."
+    parsed = self.json.loads(record)
+    if isinstance(parsed, basestring):
+      return parsed, None
+    if not isinstance(parsed, dict) or not 'formula' in parsed:
+      raise ValueError('JSON record should be a string or have a "formula"')
+    return parsed['formula'], parsed.get('id')
+
+  def serialize(self, html, error, identifier):
+    "Serialize the result of a record for output."
+    "A failed record is written as an empty record, or as an error in JSON."
+    if self.mode == 'json':
+      result = dict()
+      if identifier != None:
+        result['id'] = identifier
+      if error != None:
+        result['error'] = error
+      else:
+        result['html'] = html
+      return self.json.dumps(result)
+    if error != None:
+      return ''
+    if self.mode == 'lines':
+      # a newline in HTML is just whitespace
+      html = html.replace('\n', ' ')
+    else:
+      html = html.replace('\0', '')
+    return html.encode('utf-8')
+
+def usage():
+  "Show the usage and exit."
+  Trace.error('Usage: math2html.py escaped_string')
+  Trace.error('   or: math2html.py --batch lines|nul|json < formulas')
+  Trace.error('Batch mode reads formulas from standard input, separated by newlines,')
+  Trace.error('by NUL characters or as JSON lines (a string or {"formula": ..., "id": ...}),')
+  Trace.error('and writes one HTML result per formula with the same separator.')
+  exit()
 
 def main():
   "Main function, called if invoked from elyxer.the command line"
   args = sys.argv
   Options().parseoptions(args)
+  if Options.batch:
+    if len(args) != 0 or not Options.batch in BatchConverter.delimiters:
+      usage()
+    BatchConverter(Options.batch).convert(sys.stdin, sys.stdout)
+    FormulaCache.cache.report()
+    return
   if len(args) != 1:
-    Trace.error('Usage: math2html.py escaped_string')
-    exit()
+    usage()
   result = math2html(args[0])
   Trace.message(result)
+  FormulaCache.cache.report()
 
 if __name__ == '__main__':
   main()